@@ -1,5 +1,8 @@
 import os
 
+import pytest
+from django.test.utils import override_settings
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +40,11 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_cache():
+    # Не трогать файл кеша сайта: тесты вызывают cache.clear().
+    from core.testing import TEST_CACHES
+    with override_settings(CACHES=TEST_CACHES):
+        yield
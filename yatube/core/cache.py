@@ -0,0 +1,234 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Время обращения к записи обновляется не чаще раза в столько секунд:
+# чтения не должны каждый раз брать блокировку на запись.
+TOUCH_INTERVAL = 1
+# Сколько ждать блокировку базы, занятую другим процессом, в секундах.
+BUSY_TIMEOUT = 5
+# Ограничение SQLite на число параметров запроса с запасом.
+MAX_QUERY_PARAMS = 900
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+    'expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_entries_accessed '
+    'ON cache_entries (accessed)',
+)
+
+
+def encode(value):
+    # Целые числа хранятся как есть, чтобы incr не распаковывал pickle.
+    if type(value) is int:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+def chunked(items):
+    items = list(items)
+    for start in range(0, len(items), MAX_QUERY_PARAMS):
+        yield items[start:start + MAX_QUERY_PARAMS]
+
+
+def placeholders(items):
+    return ', '.join('?' * len(items))
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кеш в файле SQLite, общий для всех процессов одного сервера.
+
+    База работает в режиме WAL: читатели не ждут писателей. Изменения
+    из нескольких запросов (add, incr, запись с вытеснением) выполняются
+    в транзакции BEGIN IMMEDIATE и потому атомарны между процессами.
+    Когда записей больше MAX_ENTRIES, удаляются сначала просроченные,
+    затем 1/CULL_FREQUENCY давно не читавшихся (LRU).
+    LOCATION -- путь к файлу базы.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса: после
+        # fork унаследованное соединение использовать нельзя.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key = ? AND expires <= ?',
+                (key, now)
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache_entries VALUES (?, ?, ?, ?)',
+                (key, encode(value), self.get_backend_timeout(timeout), now)
+            ).rowcount == 1
+            if added:
+                self._cull(connection, now)
+        return added
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        connection = self._connection()
+        found, stale = {}, []
+        for part in chunked(keys):
+            rows = connection.execute(
+                'SELECT key, value, expires, accessed FROM cache_entries '
+                f'WHERE key IN ({placeholders(part)})',
+                part
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[keys[key]] = decode(value)
+                if accessed < now - TOUCH_INTERVAL:
+                    stale.append(key)
+        if stale:
+            with self._transaction() as connection:
+                for part in chunked(stale):
+                    connection.execute(
+                        'UPDATE cache_entries SET accessed = ? '
+                        f'WHERE key IN ({placeholders(part)})',
+                        [now, *part]
+                    )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version), encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self._cull(connection, now)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            return connection.execute(
+                'UPDATE cache_entries SET expires = ?, accessed = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now)
+            ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        cache_key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache_entries '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (cache_key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = decode(row[0]) + delta
+            connection.execute(
+                'UPDATE cache_entries SET value = ?, accessed = ? '
+                'WHERE key = ?',
+                (encode(value), now, cache_key)
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection().execute(
+            'SELECT 1 FROM cache_entries '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for part in chunked(keys):
+                connection.execute(
+                    'DELETE FROM cache_entries '
+                    f'WHERE key IN ({placeholders(part)})',
+                    part
+                )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def _cull(self, connection, now):
+        count, = connection.execute(
+            'SELECT COUNT(*) FROM cache_entries').fetchone()
+        if count <= self._max_entries:
+            return
+        count -= connection.execute(
+            'DELETE FROM cache_entries WHERE expires <= ?', (now,)
+        ).rowcount
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entries')
+            return
+        connection.execute(
+            'DELETE FROM cache_entries WHERE key IN ('
+            'SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,)
+        )
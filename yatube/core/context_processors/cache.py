@@ -0,0 +1,8 @@
+from django.conf import settings
+
+
+def fragment_cache_timeout(request):
+    """Добавляет время жизни кеша фрагментов шаблонов, в секундах."""
+    return {
+        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(connection, pragmas):
+    """
+    Выполняет PRAGMA из словаря {имя: значение} на соединении DB-API
+    sqlite3. Порядок важен: journal_mode должен идти до остальных.
+    """
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """
+    Настраивает каждое новое соединение с SQLite по SQLITE_PRAGMAS:
+    WAL, ожидание занятой базы вместо ошибки «database is locked»,
+    mmap и размер страничного кеша.
+    """
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+GET_MANY_SIZE = 10
+
+
+def set_in_child(cache):
+    cache.set('written-by-child', True)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кеша LocMemCache, FileBasedCache и SQLiteCache: '
+        'время set, get, get_many и incr и видны ли записи другому '
+        'процессу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--value-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            params = {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}}
+            backends = (
+                ('locmem', LocMemCache('bench', params)),
+                ('file', FileBasedCache(
+                    os.path.join(directory, 'files'), params)),
+                ('sqlite', SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), params)),
+            )
+            for name, cache in backends:
+                self.measure(name, cache, options)
+
+    def measure(self, name, cache, options):
+        keys = [f'key-{number}' for number in range(options['keys'])]
+        value = 'x' * options['value_size']
+        timings = {
+            'set': self.timed(lambda: [cache.set(key, value) for key in keys]),
+            'get': self.timed(lambda: [cache.get(key) for key in keys]),
+            'get_many': self.timed(lambda: [
+                cache.get_many(keys[start:start + GET_MANY_SIZE])
+                for start in range(0, len(keys), GET_MANY_SIZE)
+            ]),
+        }
+        cache.set('counter', 0)
+        timings['incr'] = self.timed(
+            lambda: [cache.incr('counter') for _ in keys])
+        child = multiprocessing.get_context('fork').Process(
+            target=set_in_child, args=(cache,))
+        child.start()
+        child.join()
+        shared = 'да' if cache.get('written-by-child') else 'нет'
+        report = ', '.join(
+            f'{operation} {seconds * 1e6 / len(keys):.1f} мкс'
+            for operation, seconds in timings.items()
+        )
+        self.stdout.write(
+            f'{name:>6}: {report} на операцию; '
+            f'общий между процессами: {shared}'
+        )
+
+    @staticmethod
+    def timed(function):
+        started = time.perf_counter()
+        function()
+        return time.perf_counter() - started
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+SCHEMA = (
+    'CREATE TABLE posts ('
+    'id INTEGER PRIMARY KEY, author INTEGER NOT NULL, '
+    'pub_date REAL NOT NULL, text TEXT NOT NULL)',
+    'CREATE INDEX posts_author_feed ON posts (author, pub_date)',
+)
+AUTHORS = 100
+PAGE_SIZE = 10
+TEXT = 'x' * 500
+
+
+def handle_request(connection, write):
+    """
+    Один «запрос страницы»: лента автора и пост по id, а при write ещё
+    и новый пост в отдельной транзакции, как при сохранении формы.
+    """
+    author = random.randrange(AUTHORS)
+    connection.execute(
+        'SELECT id, text FROM posts WHERE author = ? '
+        'ORDER BY pub_date DESC LIMIT ?',
+        (author, PAGE_SIZE)
+    ).fetchall()
+    connection.execute(
+        'SELECT text FROM posts WHERE id = ?',
+        (random.randrange(1, 1000),)
+    ).fetchone()
+    if write:
+        with connection:
+            connection.execute(
+                'INSERT INTO posts (author, pub_date, text) VALUES (?, ?, ?)',
+                (author, time.time(), TEXT)
+            )
+
+
+def worker(path, pragmas, persistent, deadline, write_ratio, results):
+    random.seed(os.getpid())
+    connection = None
+    latencies = []
+    errors = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                # Параметры соединения те же, что у бэкенда sqlite3 Django.
+                connection = sqlite3.connect(path)
+                apply_pragmas(connection, pragmas)
+            handle_request(connection, random.random() < write_ratio)
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+        if not persistent:
+            connection.close()
+            connection = None
+    results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при одновременных '
+        'чтениях и записях из нескольких процессов: с настройками по '
+        'умолчанию и новым соединением на каждый запрос и с SQLITE_PRAGMAS '
+        'и постоянными соединениями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Сколько секунд нагружать базу в каждом режиме.'
+        )
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Доля запросов, которые пишут в базу.'
+        )
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('default', {}, False),
+            ('tuned', settings.SQLITE_PRAGMAS, True),
+        )
+        for name, pragmas, persistent in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.create_database(path, options['rows'])
+                self.measure(name, path, pragmas, persistent, options)
+
+    @staticmethod
+    def create_database(path, rows):
+        connection = sqlite3.connect(path)
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                'INSERT INTO posts (author, pub_date, text) VALUES (?, ?, ?)',
+                (
+                    (number % AUTHORS, number, TEXT)
+                    for number in range(rows)
+                )
+            )
+        connection.close()
+
+    def measure(self, name, path, pragmas, persistent, options):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.time() + options['duration']
+        workers = [
+            context.Process(
+                target=worker,
+                args=(
+                    path, pragmas, persistent, deadline,
+                    options['write_ratio'], results
+                )
+            )
+            for _ in range(options['workers'])
+        ]
+        for process in workers:
+            process.start()
+        latencies = []
+        errors = 0
+        for _ in workers:
+            worker_latencies, worker_errors = results.get()
+            latencies += worker_latencies
+            errors += worker_errors
+        for process in workers:
+            process.join()
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        self.stdout.write(
+            f'{name:>7}: {len(latencies) / options["duration"]:.0f} '
+            f'запросов/с, p95 {p95 * 1000:.1f} мс, '
+            f'ошибок «database is locked»: {errors}'
+        )
@@ -0,0 +1,172 @@
+import mimetypes
+import os
+import re
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class RangeFile:
+    """
+    Отдаёт из открытого файла только length байт начиная с offset. Метода
+    fileno нет намеренно: иначе WSGI-сервер отправит через sendfile
+    весь файл, а не диапазон.
+    """
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Возвращает (начало, конец включительно) для заголовка Range с одним
+    диапазоном, None, если заголовок не разобран или диапазонов несколько
+    (тогда отдаётся весь файл), и False, если диапазон вне файла.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N: последние N байт.
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def range_applies(request, etag, mtime):
+    """Диапазон не применяется, если If-Range указывает на другую версию."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def cache_control(path):
+    if re.match(settings.MEDIA_IMMUTABLE_PATHS, path):
+        return IMMUTABLE_CACHE_CONTROL
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def offload(path, full_path):
+    """Ответ, который просит фронтенд-сервер отдать файл самому."""
+    response = HttpResponse()
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path))
+    else:
+        response['X-Sendfile'] = full_path
+    # Тип файла определит фронтенд-сервер.
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, full_path, stat, etag, content_type=None,
+                  encoding=None):
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    header = request.META.get('HTTP_RANGE')
+    byte_range = None
+    if header and range_applies(request, etag, stat.st_mtime):
+        byte_range = parse_range(header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is None:
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type)
+        response['Content-Length'] = stat.st_size
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(open(full_path, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if byte_range is not False:
+        # FileResponse в Django 2.2 заменяет text/html типом, угаданным
+        # по имени файла: page.html.gz ушёл бы как application/gzip.
+        response['Content-Type'] = content_type
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def send_file(request, full_path, cache_control, offload_path=None,
+              content_type=None, encoding=None):
+    """
+    Отдаёт файл по абсолютному пути с ETag и Last-Modified: отвечает 304
+    на условные запросы и поддерживает один диапазон байт в Range. Весь
+    файл отдаётся через FileResponse, то есть через wsgi.file_wrapper и
+    sendfile, если сервер их умеет. Если задан offload_path и включён
+    MEDIA_OFFLOAD, файл отдаёт фронтенд-сервер.
+    """
+    try:
+        stat = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404
+    if not S_ISREG(stat.st_mode):
+        raise Http404
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if settings.MEDIA_OFFLOAD and offload_path is not None:
+            response = offload(offload_path, full_path)
+        else:
+            response = file_response(
+                request, full_path, stat, etag, content_type, encoding)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """
+    Отдаёт файл из MEDIA_ROOT. Файлы с неизменяемыми именами
+    (MEDIA_IMMUTABLE_PATHS) кешируются надолго. При MEDIA_OFFLOAD отдачу
+    берёт на себя nginx (X-Accel-Redirect) или Apache/lighttpd
+    (X-Sendfile).
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    return send_file(
+        request, full_path, cache_control(path), offload_path=path)
@@ -0,0 +1,129 @@
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from .media import IMMUTABLE_CACHE_CONTROL, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Имена вида logo.0a1b2c3d4e5f.png, которые даёт ManifestStaticFilesStorage.
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.svg', '.ico', '.json', '.txt', '.html', '.xml',
+    '.map', '.ttf', '.eot', '.otf',
+)
+# Кодировки в порядке предпочтения: (Content-Encoding, расширение).
+PRECOMPRESSED = (
+    ('br', '.br'),
+    ('gzip', '.gz'),
+)
+
+
+def compress(path):
+    """
+    Пишет рядом с файлом сжатые копии .gz и, если установлен brotli, .br.
+    Копия не пишется, если она не меньше исходного файла.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    copies = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies['.br'] = brotli.compress(data, quality=11)
+    for extension, compressed in copies.items():
+        if len(compressed) < len(data):
+            with open(path + extension, 'wb') as copy:
+                copy.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Добавляет к именам собранных collectstatic файлов хеш содержимого и
+    сжимает текстовые файлы заранее. Пока collectstatic не запускался
+    (разработка, тесты), ссылки ведут на файлы без хеша.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Ни манифеста, ни собранного файла: ссылаемся на исходное имя.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in names:
+            if name and name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                compress(self.path(name))
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме отключённых через q=0."""
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1
+        except ValueError:
+            quality = 1
+        if quality > 0:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+@require_safe
+def serve(request, path):
+    """
+    Отдаёт собранную статику из STATIC_ROOT. Если клиент принимает br
+    или gzip и рядом лежит сжатая копия, отдаётся она. Файлы с хешем в
+    имени кешируются на год, остальные проверяются при каждом запросе.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if HASHED_NAME_RE.search(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = 'no-cache'
+    content_type, encoding = mimetypes.guess_type(full_path)
+    encodings = accepted_encodings(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = None
+    if encoding is None:
+        for name, extension in PRECOMPRESSED:
+            if name in encodings and os.path.isfile(full_path + extension):
+                response = send_file(
+                    request,
+                    full_path + extension,
+                    cache_control,
+                    content_type=content_type,
+                    encoding=name
+                )
+                break
+    if response is None:
+        response = send_file(request, full_path, cache_control)
+    if path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,24 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Кеш тестов: в памяти процесса, а не в общем файле SQLiteCache, иначе
+# cache.clear() в тестах очищал бы кеш запущенного на той же машине сайта.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+
+class IsolatedCacheTestRunner(DiscoverRunner):
+    """Запускает тесты с кешем TEST_CACHES."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.isolated_cache = override_settings(CACHES=TEST_CACHES)
+        self.isolated_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_cache.disable()
+        super().teardown_test_environment(**kwargs)
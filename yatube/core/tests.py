@@ -1,6 +1,24 @@
-from django.test import TestCase
+import gzip
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings, SimpleTestCase, TestCase
+
+from .cache import SQLiteCache
+from .db import apply_pragmas
+
+MEDIA_CONTENT = b'0123456789'
+STATIC_CONTENT = b'body { color: black; }\n' * 100
+
 
 class ViewTests(TestCase):
     def test_404_error_page(self):
@@ -11,3 +29,241 @@ class ViewTests(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class TestCacheTests(SimpleTestCase):
+    def test_tests_do_not_use_site_cache(self):
+        """Тесты работают с кешем в памяти, а не с файлом кеша сайта."""
+        self.assertIsInstance(caches['default'], LocMemCache)
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name in ('posts/file.txt', 'cache/ab/thumbnail.jpg'):
+            path = os.path.join(directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as media_file:
+                media_file.write(MEDIA_CONTENT)
+
+    def test_file_served_with_validators(self):
+        """
+        Файл отдаётся целиком с ETag и Last-Modified, а повторный запрос
+        с ними получает 304 без тела.
+        """
+        response = self.client.get('/media/posts/file.txt')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), MEDIA_CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        for header, value in (
+            ('HTTP_IF_NONE_MATCH', response['ETag']),
+            ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified']),
+        ):
+            with self.subTest(header=header):
+                cached = self.client.get(
+                    '/media/posts/file.txt', **{header: value})
+                self.assertEqual(
+                    cached.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        """Запрос с Range получает только нужные байты или 416."""
+        ranges = {
+            'bytes=2-4': b'234',
+            'bytes=7-': b'789',
+            'bytes=-2': b'89',
+        }
+        for header, content in ranges.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/media/posts/file.txt', HTTP_RANGE=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(
+                    b''.join(response.streaming_content), content)
+        response = self.client.get(
+            '/media/posts/file.txt', HTTP_RANGE='bytes=20-')
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_thumbnails_cached_as_immutable(self):
+        """Миниатюры кешируются надолго, обычные файлы -- нет."""
+        response = self.client.get('/media/cache/ab/thumbnail.jpg')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get('/media/posts/file.txt')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect')
+    def test_offload_to_front_end_server(self):
+        """В режиме X-Accel-Redirect файл отдаёт nginx."""
+        response = self.client.get('/media/posts/file.txt')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/file.txt')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root_not_found(self):
+        """Файлы вне MEDIA_ROOT и каталоги не отдаются."""
+        for path in ('/media/../manage.py', '/media/posts/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'static')
+        self.static_root = os.path.join(directory.name, 'staticfiles')
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'wb') as css:
+            css.write(STATIC_CONTENT)
+        with open(os.path.join(source, 'page.html'), 'wb') as html:
+            html.write(STATIC_CONTENT)
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source],
+            STATIC_ROOT=self.static_root,
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+            paths = json.load(f)['paths']
+        self.hashed_name = paths['css/site.css']
+        self.hashed_html_name = paths['page.html']
+
+    def test_collectstatic_writes_compressed_copies(self):
+        """collectstatic добавляет хеш к имени и сжимает копию в gzip."""
+        path = os.path.join(self.static_root, self.hashed_name + '.gz')
+        with gzip.open(path) as compressed:
+            self.assertEqual(compressed.read(), STATIC_CONTENT)
+
+    def test_compressed_copy_served_when_accepted(self):
+        """
+        Клиент, принимающий gzip, получает сжатую копию; файл с хешем в
+        имени кешируется надолго.
+        """
+        url = '/static/' + self.hashed_name
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(
+            b''.join(response.streaming_content), STATIC_CONTENT)
+
+    def test_compressed_html_keeps_its_content_type(self):
+        """Сжатая копия HTML-файла отдаётся с типом text/html."""
+        response = self.client.get(
+            '/static/' + self.hashed_html_name, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/html')
+
+
+def incr_many(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(
+            self.path, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}})
+
+    def test_values_are_shared_between_instances(self):
+        """Записи одного экземпляра кеша видны другому с тем же файлом."""
+        self.cache.set_many({'a': [1, 2], 'b': 'текст', 'c': 3})
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(
+            other.get_many(['a', 'b', 'c', 'd']),
+            {'a': [1, 2], 'b': 'текст', 'c': 3}
+        )
+        self.assertFalse(other.add('a', 'другое'))
+        self.assertTrue(other.add('d', None))
+        self.assertIsNone(self.cache.get('d', 'нет'))
+
+    def test_expired_entries_are_not_returned(self):
+        """Просроченные записи не отдаются и не мешают add."""
+        self.cache.set('a', 1, timeout=0)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertFalse(self.cache.has_key('a'))
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_least_recently_used_entries_are_culled(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        for number, key in enumerate('abcd'):
+            self.cache.set(key, number)
+        self.cache._connection().execute(
+            'UPDATE cache_entries SET accessed = accessed - 100 '
+            'WHERE key != ?',
+            (self.cache.make_key('a'),)
+        )
+        self.cache.set('e', 4)
+        self.assertEqual(
+            sorted(self.cache.get_many('abcde')), ['a', 'd', 'e'])
+
+    def test_incr_is_atomic_between_processes(self):
+        """incr из нескольких процессов не теряет приращений."""
+        self.cache.set('counter', 0)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=incr_many, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+
+    def test_touch_changes_timeout(self):
+        """touch меняет срок жизни только существующей записи."""
+        self.cache.set('a', 1)
+        self.assertFalse(self.cache.touch('b'))
+        self.assertTrue(self.cache.touch('a', timeout=0))
+        self.assertIsNone(self.cache.get('a'))
+
+
+class SQLitePragmasTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_connection_gets_pragmas_from_settings(self):
+        """Соединение Django с базой получает настройки SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            cache_size = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+        self.assertEqual(cache_size, settings.SQLITE_PRAGMAS['cache_size'])
+        # 1 -- NORMAL.
+        self.assertEqual(synchronous, 1)
+
+    def test_file_database_switches_to_wal(self):
+        """База в файле переходит в режим WAL и получает mmap."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = sqlite3.connect(os.path.join(directory.name, 'db.sqlite3'))
+        self.addCleanup(database.close)
+        apply_pragmas(database, settings.SQLITE_PRAGMAS)
+        self.assertEqual(
+            database.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(
+            database.execute('PRAGMA mmap_size').fetchone()[0],
+            settings.SQLITE_PRAGMAS['mmap_size']
+        )
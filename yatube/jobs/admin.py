@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'task', 'queue', 'status', 'attempts', 'run_at', 'created')
+    list_filter = ('queue', 'status')
+    search_fields = ('task', 'last_error')
+    empty_value_display = '-пусто-'
+
+
+admin.site.register(Job, JobAdmin)
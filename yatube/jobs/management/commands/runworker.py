@@ -0,0 +1,118 @@
+import multiprocessing
+import time
+from collections import Counter
+from concurrent import futures
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs import queue
+
+
+def run_in_pool(job):
+    try:
+        return queue.run(job)
+    finally:
+        # Соединения потока или процесса пула не переживают задачу.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи из очередей в базе в пуле потоков или '
+        'процессов. Число одновременных задач очереди ограничено '
+        'JOBS_QUEUES.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pool',
+            choices=('thread', 'process'),
+            default='thread',
+            help='Выполнять задачи в потоках или в процессах.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Сколько задач выполнять одновременно.'
+        )
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Брать задачи только из этой очереди; можно повторять.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выйти, когда готовых задач не останется.'
+        )
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or list(settings.JOBS_QUEUES)
+        unknown = set(queues) - set(settings.JOBS_QUEUES)
+        if unknown:
+            raise CommandError(f'Неизвестные очереди: {", ".join(unknown)}')
+        self.limits = {name: settings.JOBS_QUEUES[name] for name in queues}
+        self.concurrency = options['concurrency']
+        executor = self.executor(options['pool'])
+        try:
+            self.work(executor, options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка: ждём выполняемые задачи.')
+        finally:
+            executor.shutdown(wait=True)
+
+    def executor(self, pool):
+        if pool == 'thread':
+            return futures.ThreadPoolExecutor(self.concurrency)
+        # Процессы пула создаются сразу и без открытых соединений родителя:
+        # соединение SQLite нельзя переносить через fork.
+        connections.close_all()
+        executor = futures.ProcessPoolExecutor(
+            self.concurrency,
+            mp_context=multiprocessing.get_context('fork')
+        )
+        executor.submit(int).result()
+        return executor
+
+    def work(self, executor, once):
+        running = {}
+        in_flight = Counter()
+        while True:
+            for future in [future for future in running if future.done()]:
+                job = running.pop(future)
+                in_flight[job.queue] -= 1
+                self.report(job, future)
+            free = [
+                name for name, limit in self.limits.items()
+                if in_flight[name] < limit
+            ]
+            job = None
+            if free and len(running) < self.concurrency:
+                job = queue.claim(free)
+            if job is not None:
+                running[executor.submit(run_in_pool, job)] = job
+                in_flight[job.queue] += 1
+            elif running:
+                futures.wait(
+                    running,
+                    timeout=settings.JOBS_POLL_INTERVAL,
+                    return_when=futures.FIRST_COMPLETED
+                )
+            elif once:
+                return
+            else:
+                time.sleep(settings.JOBS_POLL_INTERVAL)
+
+    def report(self, job, future):
+        try:
+            done = future.result()
+        except Exception as error:
+            done = False
+            self.stderr.write(f'{job.task} #{job.pk}: сбой воркера {error!r}')
+        status = 'выполнена' if done else 'ошибка'
+        self.stdout.write(
+            f'{job.task} #{job.pk}, попытка {job.attempts}: {status}')
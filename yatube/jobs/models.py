@@ -0,0 +1,59 @@
+import json
+
+from django.db import models
+from django.utils import timezone
+
+from core.models import CreatedModel
+
+
+class Job(CreatedModel):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    queue = models.CharField('Очередь', max_length=50)
+    task = models.CharField(
+        'Задача',
+        max_length=200,
+        help_text='Путь к функции задачи, например posts.thumbnails.generate'
+    )
+    payload = models.TextField('Аргументы', default='{}')
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=5)
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_until = models.DateTimeField(
+        'Занята воркером до',
+        blank=True,
+        null=True
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(
+                fields=['queue', 'status', 'run_at'],
+                name='job_queue_ready_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.task} ({self.get_status_display()})'
+
+    @property
+    def arguments(self):
+        payload = json.loads(self.payload)
+        return payload['args'], payload['kwargs']
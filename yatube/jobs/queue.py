@@ -0,0 +1,121 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Сколько готовых задач просматривать за один захват: если первую
+# перехватил другой воркер, берётся следующая.
+CLAIM_CANDIDATES = 10
+
+
+def task(queue='default', max_attempts=None):
+    """
+    Делает функцию фоновой задачей: function.enqueue(*args, **kwargs)
+    ставит её вызов в очередь queue. Аргументы должны сериализоваться
+    в JSON, а сама функция -- импортироваться по пути модуля.
+    """
+    def decorator(function):
+        function.queue = queue
+        function.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        function.enqueue = partial(enqueue, function)
+        return function
+    return decorator
+
+
+def task_name(function):
+    return f'{function.__module__}.{function.__qualname__}'
+
+
+def enqueue(function, *args, **kwargs):
+    """
+    Ставит задачу в очередь, когда текущая транзакция зафиксирована: воркер
+    не возьмёт задачу, данные для которой ещё не видны или откатятся.
+    """
+    payload = json.dumps({'args': args, 'kwargs': kwargs})
+    transaction.on_commit(lambda: Job.objects.create(
+        queue=function.queue,
+        task=task_name(function),
+        payload=payload,
+        max_attempts=function.max_attempts,
+    ))
+
+
+def ready(queues, now):
+    """Задачи, которые можно взять: ждущие в очереди и брошенные воркером."""
+    return Q(queue__in=queues) & (
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(queues):
+    """
+    Берёт одну готовую задачу из очередей queues. Захват -- условный
+    UPDATE, поэтому одну задачу не возьмут два воркера. Задача видна
+    другим воркерам снова, если не завершится за JOBS_VISIBILITY_TIMEOUT.
+    """
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT)
+    candidates = Job.objects.filter(
+        ready(queues, now)
+    ).order_by('run_at')[:CLAIM_CANDIDATES]
+    for job in candidates:
+        claimed = Job.objects.filter(ready(queues, now), pk=job.pk).update(
+            status=Job.RUNNING,
+            locked_until=locked_until,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job.status = Job.RUNNING
+            job.locked_until = locked_until
+            job.attempts += 1
+            return job
+    return None
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка перед следующей попыткой, в секундах."""
+    return min(
+        settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOBS_MAX_RETRY_DELAY
+    )
+
+
+def run(job):
+    """
+    Выполняет захваченную задачу. Успешная задача удаляется, упавшая
+    возвращается в очередь с задержкой или, когда попытки кончились,
+    помечается невыполненной. Если задачу уже перехватил другой воркер,
+    результат этого запуска не записывается.
+    """
+    own = Job.objects.filter(pk=job.pk, locked_until=job.locked_until)
+    args, kwargs = job.arguments
+    try:
+        import_string(job.task)(*args, **kwargs)
+    except Exception:
+        logger.exception('Задача %s #%s упала', job.task, job.pk)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            own.update(status=Job.FAILED, locked_until=None, last_error=error)
+        else:
+            own.update(
+                status=Job.QUEUED,
+                locked_until=None,
+                run_at=timezone.now() + timedelta(
+                    seconds=retry_delay(job.attempts)),
+                last_error=error,
+            )
+        return False
+    own.delete()
+    return True
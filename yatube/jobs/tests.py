@@ -0,0 +1,81 @@
+import json
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+
+CALLS = []
+
+
+@queue.task()
+def remember(value):
+    CALLS.append(value)
+
+
+@queue.task(max_attempts=2)
+def fail():
+    raise RuntimeError('сбой задачи')
+
+
+def create_job(function, *args):
+    return Job.objects.create(
+        queue=function.queue,
+        task=queue.task_name(function),
+        payload=json.dumps({'args': args, 'kwargs': {}}),
+        max_attempts=function.max_attempts,
+    )
+
+
+@override_settings(JOBS_RETRY_DELAY=10, JOBS_MAX_RETRY_DELAY=15)
+class QueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_claimed_job_runs_and_is_deleted(self):
+        """Захваченная задача выполняется и удаляется из очереди."""
+        create_job(remember, 'значение')
+        job = queue.claim(['default'])
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(queue.claim(['default']))
+        self.assertTrue(queue.run(job))
+        self.assertEqual(CALLS, ['значение'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_claim_respects_queues(self):
+        """Воркер берёт задачи только из своих очередей."""
+        create_job(remember, 1)
+        self.assertIsNone(queue.claim(['email']))
+        self.assertIsNotNone(queue.claim(['email', 'default']))
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """Упавшая задача повторяется с задержкой, пока есть попытки."""
+        create_job(fail)
+        started = timezone.now()
+        self.assertFalse(queue.run(queue.claim(['default'])))
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('сбой задачи', job.last_error)
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10))
+        self.assertIsNone(queue.claim(['default']))
+        Job.objects.update(run_at=started)
+        self.assertFalse(queue.run(queue.claim(['default'])))
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertEqual(queue.retry_delay(3), 15)
+
+    def test_abandoned_job_is_claimed_again(self):
+        """
+        Задача брошенного воркера снова доступна после таймаута, а
+        результат опоздавшего воркера не записывается.
+        """
+        create_job(remember, 1)
+        abandoned = queue.claim(['default'])
+        Job.objects.update(locked_until=timezone.now() - timedelta(1))
+        job = queue.claim(['default'])
+        self.assertEqual(job.attempts, 2)
+        queue.run(abandoned)
+        self.assertTrue(Job.objects.exists())
+        queue.run(job)
+        self.assertFalse(Job.objects.exists())
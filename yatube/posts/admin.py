@@ -1,16 +1,49 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Group, Post
+from .paginators import EstimatedCountPaginator
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'group':
+            # Список групп читается одним запросом на весь ответ, а не в
+            # каждой строке списка постов с редактируемой группой. iter()
+            # нужен, чтобы list() не спрашивал длину через COUNT(*).
+            if not hasattr(request, 'group_choices'):
+                request.group_choices = list(iter(formfield.choices))
+            formfield.choices = request.group_choices
+        return formfield
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тому же индексу FTS5, что и на сайте, а не LIKE.
+        return search.filter_posts(queryset, search_term), False
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
+    date_hierarchy = 'created'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,109 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from . import caching, thumbnails
+from .models import ImageBlob, Post
+
+logger = logging.getLogger(__name__)
+
+
+def acquire(name):
+    if not name:
+        return
+    ImageBlob.objects.bulk_create(
+        [ImageBlob(name=name)], ignore_conflicts=True)
+    ImageBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name):
+    """
+    Отпускает ссылку на файл. Файл и его миниатюры удаляются после
+    фиксации транзакции, если ссылок к тому времени не осталось.
+    """
+    if not name:
+        return
+    ImageBlob.objects.filter(name=name).update(refs=F('refs') - 1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def move(old_name, new_name):
+    """
+    Переводит все посты со старого файла на новый вместе со ссылками;
+    старый файл удаляется, если ссылок на него не осталось. Варианты
+    старого файла удаляются вместе с ним, поэтому у постов они
+    сбрасываются и строятся заново для нового файла.
+    """
+    with transaction.atomic():
+        posts = list(
+            Post.objects.filter(image=old_name).values_list(
+                'pk', 'author_id', 'group_id')
+        )
+        # update не шлёт сигналов: кеш и варианты обновляются ниже.
+        moved = Post.objects.filter(
+            pk__in=[pk for pk, _, _ in posts], image=old_name
+        ).update(
+            image=new_name,
+            image_width=None,
+            image_height=None,
+            image_variants='',
+            updated=timezone.now(),
+        )
+        ImageBlob.objects.bulk_create(
+            [ImageBlob(name=new_name)], ignore_conflicts=True)
+        ImageBlob.objects.filter(name=new_name).update(
+            refs=F('refs') + moved)
+        ImageBlob.objects.filter(name=old_name).update(
+            refs=F('refs') - moved)
+        feeds = set()
+        for pk, author_id, group_id in posts:
+            feeds.update(caching.post_feeds(author_id, group_id))
+            feeds.add(caching.post_page(pk))
+            thumbnails.generate.enqueue(pk, new_name)
+        caching.bump_generations(feeds)
+    collect(old_name)
+
+
+def recently_touched(storage, name):
+    try:
+        modified = os.path.getmtime(storage.path(name))
+    except (OSError, SuspiciousFileOperation):
+        return False
+    return time.time() - modified < settings.POST_IMAGE_COLLECT_MIN_AGE
+
+
+def collect(name):
+    """
+    Удаляет файл без ссылок вместе с вариантами и миниатюрами. Недавно
+    сохранённый файл остаётся: его могла только что переиспользовать
+    загрузка того же содержимого, ещё не взявшая ссылку (см.
+    ContentAddressedStorage._save). Если ссылка так и не появится, файл
+    удалит collect_media.
+    """
+    with transaction.atomic():
+        deleted, _ = ImageBlob.objects.filter(
+            name=name, refs__lte=0).delete()
+    if not deleted:
+        return
+    storage = Post._meta.get_field('image').storage
+    if recently_touched(storage, name):
+        return
+    try:
+        thumbnails.delete_variants(name)
+    except (OSError, SuspiciousFileOperation):
+        logger.warning(
+            'Не удалось удалить варианты картинки %s', name, exc_info=True)
+    try:
+        delete(ImageFile(name, storage=storage))
+    except (OSError, SuspiciousFileOperation):
+        # Файла уже нет или он вне хранилища: ссылок на него всё равно
+        # не осталось, а запрос, удаливший пост, падать не должен.
+        logger.warning('Не удалось удалить картинку %s', name, exc_info=True)
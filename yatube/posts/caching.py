@@ -0,0 +1,192 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+
+INDEX_FEED = 'index'
+# Параметры запроса, от которых зависит страница ленты
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def group_feed(group_id):
+    return f'group:{group_id}'
+
+
+def profile_feed(author_id):
+    return f'profile:{author_id}'
+
+
+def follow_feed(user_id):
+    return f'follow:{user_id}'
+
+
+def post_page(post_id):
+    return f'post:{post_id}'
+
+
+def author_stats(author_id):
+    return f'author:{author_id}'
+
+
+def post_feeds(author_id, group_id):
+    """Ленты, в которых показывается пост автора author_id из группы."""
+    feeds = [INDEX_FEED, profile_feed(author_id)]
+    if group_id is not None:
+        feeds.append(group_feed(group_id))
+    return feeds
+
+
+def count_key(feed):
+    return f'feed-count:{feed}'
+
+
+def get_count(feed):
+    return cache.get(count_key(feed))
+
+
+def set_count(feed, count):
+    cache.set(count_key(feed), count, settings.FEED_COUNT_TIMEOUT)
+
+
+def shift_counts(feeds, delta):
+    """
+    Сдвигает закешированное число постов лент после фиксации транзакции:
+    откаченная запись числа не меняет. Если числа в кеше нет, его
+    посчитает первый же запрос страницы.
+    """
+    keys = [count_key(feed) for feed in feeds]
+
+    def shift():
+        for key in keys:
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                pass
+    transaction.on_commit(shift)
+
+
+def forget_counts(feeds):
+    """Удаляет закешированные числа постов лент после фиксации."""
+    keys = [count_key(feed) for feed in feeds]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def generation_key(feed):
+    return f'feed-generation:{feed}'
+
+
+def new_generation():
+    # Поколение от времени, а не с единицы: если ключ вытеснят из кеша,
+    # старые фрагменты с прежним номером не оживут.
+    return int(time.time() * 1000)
+
+
+def get_generation(feed):
+    """
+    Текущее поколение ленты. Оно входит в ключи кеша фрагментов, поэтому
+    при смене поколения все закешированные страницы ленты устаревают разом.
+    """
+    key = generation_key(feed)
+    generation = cache.get(key)
+    if generation is None:
+        generation = new_generation()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_generations(feeds):
+    """
+    Сдвигает поколения лент сразу и, если запись идёт в транзакции, ещё
+    раз после её фиксации. Читатель, успевший между сдвигом и фиксацией
+    отрисовать старые данные под новым поколением, закеширует их
+    ненадолго: второй сдвиг сделает и эти записи устаревшими.
+    """
+    keys = [generation_key(feed) for feed in feeds]
+
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, new_generation(), None)
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def get_generations(feeds):
+    """Поколения нескольких лент за одно обращение к кешу."""
+    keys = {generation_key(feed): feed for feed in feeds}
+    found = cache.get_many(keys)
+    return {
+        feed: found[key] if key in found else get_generation(feed)
+        for key, feed in keys.items()
+    }
+
+
+def tag_page(request, *feeds):
+    """
+    Отмечает ленты, от которых зависит страница: кеш страниц для гостей
+    отдаёт её, пока поколения этих лент не сменились. Возвращает поколение
+    первой ленты -- его же шаблоны используют в ключах фрагментов.
+    """
+    generations = get_generations(feeds)
+    request.page_generations = {
+        **getattr(request, 'page_generations', {}), **generations}
+    return generations[feeds[0]]
+
+
+def page_key(request):
+    """
+    Ключ страницы из пути и параметров листания. Для запросов с другими
+    параметрами ключа нет (None): каждый случайный параметр заводил бы
+    в кеше свою копию страницы.
+    """
+    if not set(request.GET) <= set(PAGE_PARAMS):
+        return None
+    params = urlencode(sorted(
+        (name, request.GET[name]) for name in request.GET))
+    url = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return f'anonymous-page:{request.method}:{url}'
+
+
+def cache_anonymous_page(view):
+    """
+    Кеширует ответы view целиком для гостей. Вместе с ответом хранятся
+    поколения лент, отмеченных через tag_page; запись постов и комментариев
+    сдвигает поколения, и устаревшие страницы перестают отдаваться.
+    Поколения сдвигаются ещё раз после фиксации записи (bump_generations),
+    так что страница, отрисованная до фиксации, не переживёт её.
+    Ответы, которые ставят cookie, и запросы с параметрами, кроме
+    PAGE_PARAMS, не кешируются. Заголовок X-Cache
+    показывает, был ли ответ взят из кеша.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = page_key(request)
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated or key is None):
+            return view(request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            generations, response = cached
+            if get_generations(generations) == generations:
+                response['X-Cache'] = 'HIT'
+                return response
+        response = view(request, *args, **kwargs)
+        generations = getattr(request, 'page_generations', None)
+        if (generations and response.status_code == 200
+                and not response.cookies):
+            cache.set(
+                key,
+                (generations, response),
+                settings.ANONYMOUS_PAGE_CACHE_TIMEOUT
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
@@ -0,0 +1,107 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shift(queryset, **deltas):
+    return queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def shift_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def shift_post(post_id, delta):
+    """
+    Сдвигает число комментариев поста и отмечает пост изменённым: от даты
+    изменения зависит кеш отрисованного поста.
+    """
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta,
+        updated=timezone.now()
+    )
+
+
+def shift_user(user_id, **deltas):
+    """
+    Сдвигает счётчики пользователя одним UPDATE. Если строки счётчиков ещё
+    нет, при увеличении она создаётся сразу с точными значениями; при
+    уменьшении отсутствующая строка пропускается (пользователь может
+    удаляться вместе со своими счётчиками).
+    """
+    updated = _shift(UserStats.objects.filter(user_id=user_id), **deltas)
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(
+            user_id=user_id,
+            defaults=actual_user_stats(user_id)
+        )
+
+
+def actual_user_stats(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def count_of(model, field):
+    """Подзапрос: число строк model, которые ссылаются полем field на pk."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('*')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+# Счётчик -> (модель со счётчиком, {поле: (модель строк, поле ссылки)}).
+COUNTERS = {
+    'posts': (Post, {'comments_count': (Comment, 'post')}),
+    'groups': (Group, {'posts_count': (Post, 'group')}),
+    'users': (UserStats, {
+        'posts_count': (Post, 'author'),
+        'followers_count': (Follow, 'author'),
+        'following_count': (Follow, 'user'),
+    }),
+}
+
+
+def reconcile_chunk(model, fields, pks):
+    """
+    Пересчитывает счётчики строк pks и исправляет только разошедшиеся.
+    Исправление -- один UPDATE с подзапросами на каждое поле, так что
+    параллельные изменения между проверкой и записью не теряются.
+    """
+    actual = {
+        field: count_of(rows_model, link)
+        for field, (rows_model, link) in fields.items()
+    }
+    drift = model.objects.filter(pk__in=pks).annotate(
+        **{f'actual_{field}': expression
+           for field, expression in actual.items()}
+    ).values('pk', *fields, *(f'actual_{field}' for field in fields))
+    drifted = [
+        row['pk'] for row in drift
+        if any(row[field] != row[f'actual_{field}'] for field in fields)
+    ]
+    if drifted:
+        model.objects.filter(pk__in=drifted).update(**actual)
+    return len(drifted)
+
+
+def create_missing_user_stats(user_pks):
+    missing = User.objects.filter(
+        pk__in=user_pks, stats__isnull=True
+    ).values_list('pk', flat=True)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in missing), ignore_conflicts=True)
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import caching, counters, timeline
+from .models import Follow
+
+
+def following_key(user_id):
+    return f'following-ids:{user_id}'
+
+
+def followers_key(author_id):
+    return f'follower-ids:{author_id}'
+
+
+def _cached_ids(key, queryset, field):
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(queryset.values_list(field, flat=True))
+        cache.set(key, ids, settings.FOLLOW_IDS_CACHE_TIMEOUT)
+    return ids
+
+
+def following_ids(user_id):
+    """Множество id авторов, на которых подписан читатель."""
+    return _cached_ids(
+        following_key(user_id),
+        Follow.objects.filter(user_id=user_id),
+        'author_id'
+    )
+
+
+def follower_ids(author_id):
+    """Множество id подписчиков автора."""
+    return _cached_ids(
+        followers_key(author_id),
+        Follow.objects.filter(author_id=author_id),
+        'user_id'
+    )
+
+
+def is_following(user, author):
+    if not user.is_authenticated:
+        return False
+    return author.pk in following_ids(user.pk)
+
+
+def followed_among(user, author_ids):
+    """Те id из author_ids, на которых подписан user, одним чтением."""
+    if not user.is_authenticated:
+        return set()
+    return following_ids(user.pk) & set(author_ids)
+
+
+def forget_ids(user_id, author_id):
+    """
+    Сбрасывает закешированные множества подписок сразу и ещё раз после
+    фиксации: параллельный запрос мог успеть закешировать прежнее
+    множество до неё.
+    """
+    keys = [following_key(user_id), followers_key(author_id)]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def followed(user_id, author_id):
+    """
+    Последствия новой подписки: счётчики, лента подписчика и кеши.
+    Вызывается и из follow, и из сигнала post_save модели Follow.
+    """
+    counters.shift_user(user_id, following_count=1)
+    counters.shift_user(author_id, followers_count=1)
+    timeline.mark_pulled(author_id)
+    timeline.backfill(user_id, author_id)
+    caching.forget_counts([caching.follow_feed(user_id)])
+    forget_ids(user_id, author_id)
+
+
+def unfollowed(user_id, author_id):
+    """Последствия отписки; вызывается из unfollow и из post_delete."""
+    counters.shift_user(user_id, following_count=-1)
+    counters.shift_user(author_id, followers_count=-1)
+    timeline.prune(user_id, author_id)
+    timeline.schedule_push(author_id)
+    caching.forget_counts([caching.follow_feed(user_id)])
+    forget_ids(user_id, author_id)
+
+
+def follow(user, author):
+    """
+    Подписывает user на author одним INSERT, который ничего не делает,
+    если подписка уже есть: две одновременные подписки не создадут двух
+    строк. На себя подписаться нельзя. Возвращает True, если подписка
+    появилась.
+    """
+    if user.pk == author.pk:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {Follow._meta.db_table} (user_id, author_id) '
+            'VALUES (%s, %s) ON CONFLICT DO NOTHING',
+            [user.pk, author.pk]
+        )
+        created = cursor.rowcount == 1
+    if created:
+        followed(user.pk, author.pk)
+    return created
+
+
+def unfollow(user, author):
+    """
+    Отписывает user от author одним DELETE без предварительной выборки.
+    Возвращает True, если подписка была.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Follow._meta.db_table} '
+            'WHERE user_id = %s AND author_id = %s',
+            [user.pk, author.pk]
+        )
+        deleted = cursor.rowcount > 0
+    if deleted:
+        unfollowed(user.pk, author.pk)
+    return deleted
@@ -1,4 +1,4 @@
-from django.forms import ModelForm
+from django.forms import ModelForm, ValidationError
 
 from .models import Comment, Post
 
@@ -8,6 +8,17 @@ class PostForm(ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файлы, которые отбросил обработчик загрузки, в форму не попадают:
+        # причину отказа нужно показать в поле.
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        if 'image' in self.upload_errors:
+            raise ValidationError(self.upload_errors['image'])
+        return self.cleaned_data['image']
+
 
 class CommentForm(ModelForm):
     class Meta:
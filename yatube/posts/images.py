@@ -0,0 +1,46 @@
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Форматы, которые нормализуются; остальные (например, анимированные
+# GIF) сохраняются как есть.
+SAVE_OPTIONS = {
+    'JPEG': lambda: {
+        'quality': settings.POST_IMAGE_QUALITY,
+        'optimize': True,
+        'progressive': True,
+    },
+    'PNG': lambda: {'optimize': True},
+    'WEBP': lambda: {'quality': settings.POST_IMAGE_QUALITY},
+}
+
+
+def normalize(data):
+    """
+    Поворачивает картинку по EXIF, уменьшает до POST_IMAGE_MAX_SIDE по
+    длинной стороне и пересжимает без метаданных. Возвращает новые байты
+    или None, если картинку менять не нужно или нельзя.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image_format = image.format
+        if (image_format not in SAVE_OPTIONS
+                or getattr(image, 'is_animated', False)):
+            return None
+        has_metadata = bool(image.getexif()) or 'icc_profile' in image.info
+        size = image.size
+        image = ImageOps.exif_transpose(image)
+        max_side = settings.POST_IMAGE_MAX_SIDE
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, image_format, **SAVE_OPTIONS[image_format]())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    normalized = buffer.getvalue()
+    changed = has_metadata or image.size != size
+    if not changed and len(normalized) >= len(data):
+        return None
+    return normalized
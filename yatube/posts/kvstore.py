@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+# Миниатюра, которую рисует posts/includes/post_image.html, пока у поста
+# нет готовых вариантов картинки.
+FALLBACK_GEOMETRY = '960x339'
+FALLBACK_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+class MemoryLRU:
+    """
+    Ограниченный словарь в памяти процесса: не больше size записей, каждая
+    живёт timeout секунд. Вытесняются давно не читанные записи.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set_many(self, values):
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+memory = MemoryLRU(
+    settings.THUMBNAIL_MEMORY_CACHE_SIZE,
+    settings.THUMBNAIL_MEMORY_CACHE_TIMEOUT
+)
+
+
+class PreloadingKVStore(KVStore):
+    """
+    Хранилище метаданных sorl поверх штатного cached_db: найденные записи
+    ещё и запоминаются в памяти процесса. preload() забирает записи для
+    целой страницы одним get_many из кеша и одним запросом к базе, после
+    чего тег thumbnail находит их в памяти без обращений к кешу и базе.
+    """
+
+    def preload(self, keys):
+        keys = [key for key in keys if memory.get(key) is None]
+        if not keys:
+            return
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing
+                ).values_list('key', 'value')
+            )
+            # Как и cached_db, запоминаем в кеше и отсутствие записи.
+            self.cache.set_many(
+                {key: stored.get(key, EMPTY_VALUE) for key in missing},
+                thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+            found.update(stored)
+        memory.set_many({
+            key: value for key, value in found.items()
+            if value != EMPTY_VALUE
+        })
+
+    def _get_raw(self, key):
+        value = memory.get(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                memory.set_many({key: value})
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        memory.set_many({key: value})
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        memory.delete_many(keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        memory.clear()
+
+
+def thumbnail_key(file_, geometry_string, **options):
+    """
+    Ключ записи о миниатюре в хранилище sorl. Параметры дополняются так
+    же, как в ThumbnailBackend.get_thumbnail, иначе имя миниатюры не
+    совпадёт с тем, что ищет тег thumbnail.
+    """
+    backend = default.backend
+    source = ImageFile(file_)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry_string, options)
+    return add_prefix(ImageFile(name, default.storage).key)
+
+
+def preload_thumbnails(posts):
+    """
+    Загружает в память записи о миниатюрах для постов страницы, которые
+    будут нарисованы тегом thumbnail (у них ещё нет вариантов картинки).
+    """
+    if not isinstance(default.kvstore, PreloadingKVStore):
+        return
+    default.kvstore.preload([
+        thumbnail_key(post.image, FALLBACK_GEOMETRY, **FALLBACK_OPTIONS)
+        for post in posts
+        if post.image and post.responsive_image is None
+    ])
@@ -0,0 +1,121 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from posts import counters, timeline
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.paginators import CursorPaginator
+
+BENCH_USERNAME_PREFIX = 'bench-timeline-'
+
+
+class Rollback(Exception):
+    """Откатывает все данные бенчмарка после замеров."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ленту подписок push (fan-out on write) и гибридную '
+        'push/pull на перекошенном распределении подписчиков: сколько '
+        'строк пишет публикация поста и сколько длится чтение ленты. '
+        'Все данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--posts-per-author', type=int, default=20)
+        parser.add_argument('--readers', type=int, default=50)
+        parser.add_argument('--threshold', type=int, default=200)
+        parser.add_argument('--zipf', type=float, default=1.2)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        User.objects.bulk_create(
+            User(username=f'{BENCH_USERNAME_PREFIX}{number}')
+            for number in range(options['users'])
+        )
+        users = list(User.objects.filter(
+            username__startswith=BENCH_USERNAME_PREFIX))
+        authors = users[:options['authors']]
+        self.follow_zipf(users, authors, options['zipf'])
+        followers = sorted(
+            (Follow.objects.filter(author=author).count(), author.username)
+            for author in authors
+        )
+        self.stdout.write(
+            f'Подписчиков у авторов: min {followers[0][0]}, '
+            f'медиана {followers[len(followers) // 2][0]}, '
+            f'max {followers[-1][0]}'
+        )
+        readers = random.sample(users, options['readers'])
+        modes = (
+            ('push', len(users) + 1),
+            ('hybrid', options['threshold']),
+        )
+        for mode, threshold in modes:
+            with override_settings(TIMELINE_PULL_THRESHOLD=threshold):
+                sid = transaction.savepoint()
+                for author in authors:
+                    timeline.mark_pulled(author.pk)
+                self.measure(mode, authors, readers, options)
+                transaction.savepoint_rollback(sid)
+
+    def follow_zipf(self, users, authors, exponent):
+        """Подписки с распределением Ципфа: у первых авторов их больше всех."""
+        follows = []
+        for rank, author in enumerate(authors, start=1):
+            share = 1 / rank ** exponent
+            for user in users:
+                if user != author and random.random() < share:
+                    follows.append(Follow(user=user, author=author))
+        # bulk_create не шлёт сигналов: ленты пока пустые, а счётчики
+        # подписчиков нужно пересчитать.
+        Follow.objects.bulk_create(follows)
+        user_pks = [user.pk for user in users]
+        counters.create_missing_user_stats(user_pks)
+        model, fields = counters.COUNTERS['users']
+        counters.reconcile_chunk(model, fields, user_pks)
+
+    def measure(self, mode, authors, readers, options):
+        entries_before = TimelineEntry.objects.count()
+        write_times = []
+        for _ in range(options['posts_per_author']):
+            for author in authors:
+                started = time.perf_counter()
+                Post.objects.create(text='Тестовый пост', author=author)
+                write_times.append(time.perf_counter() - started)
+        posts_count = len(write_times)
+        rows_per_post = (
+            TimelineEntry.objects.count() - entries_before) / posts_count
+        read_times = []
+        for reader in readers:
+            started = time.perf_counter()
+            paginate = CursorPaginator(timeline.follow_feed(reader), 10)
+            list(paginate.get_cursor_page())
+            read_times.append(time.perf_counter() - started)
+        self.stdout.write(
+            f'{mode:>6}: записей ленты на пост {rows_per_post:.1f}'
+            f', публикация p50 {self.ms(write_times, 50)} '
+            f'p99 {self.ms(write_times, 99)}, '
+            f'чтение ленты p50 {self.ms(read_times, 50)} '
+            f'p99 {self.ms(read_times, 99)}'
+        )
+
+    @staticmethod
+    def ms(samples, percent):
+        samples = sorted(samples)
+        index = min(len(samples) - 1, len(samples) * percent // 100)
+        return f'{samples[index] * 1000:.2f} мс'
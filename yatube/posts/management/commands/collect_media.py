@@ -0,0 +1,232 @@
+import json
+import os
+import re
+import tempfile
+import time
+from functools import reduce
+from operator import or_
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.models import ImageBlob, Post
+
+VARIANTS_DIRECTORY = 'variants'
+
+
+def walk(root, directory='', after=()):
+    """
+    Отдаёт пути файлов под root относительно него, не собирая весь список:
+    каталоги читаются os.scandir по одному. Внутри каталога записи
+    сортируются, чтобы обход шёл в одном порядке и его можно было
+    продолжить с пути after (кортеж частей пути).
+    """
+    with os.scandir(os.path.join(root, directory)) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        path = os.path.join(directory, entry.name)
+        parts = tuple(path.split(os.sep))
+        if entry.is_dir(follow_symlinks=False):
+            # Каталог целиком пройден, если after лежит дальше него.
+            if parts < after[:len(parts)]:
+                continue
+            yield from walk(root, path, after)
+        elif entry.is_file(follow_symlinks=False) and parts > after:
+            yield path, entry
+
+
+def referenced_images(names):
+    """Имена из names, на которые ссылаются посты или счётчики ссылок."""
+    return set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+    ) | set(
+        ImageBlob.objects.filter(name__in=names).values_list(
+            'name', flat=True)
+    )
+
+
+def variant_digest(name):
+    """SHA-256 картинки из имени варианта <digest>-<ширина>.<расширение>."""
+    digest = os.path.basename(name).split('-', 1)[0]
+    if thumbnails.DIGEST_RE.match(digest):
+        return digest
+    return None
+
+
+def legacy_variants(prefix):
+    """
+    Варианты картинок, сохранённых до хранилища по хешу: хеша в имени
+    таких картинок нет, поэтому их варианты берутся из постов, один раз
+    за обход.
+    """
+    names = set()
+    hashed = rf'^{re.escape(prefix)}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.[^/]+$'
+    posts = Post.objects.exclude(image='').exclude(
+        image__regex=hashed).exclude(image_variants='')
+    for variants in posts.values_list(
+            'image_variants', flat=True).iterator():
+        try:
+            names.update(variant['name'] for variant in json.loads(
+                variants))
+        except (ValueError, TypeError, KeyError):
+            continue
+    return names
+
+
+def referenced_variants(names, prefix):
+    """
+    Имена из names, которые принадлежат картинкам со ссылками. Вариант
+    назван по SHA-256 картинки, а картинки в хранилище по хешу -- по нему
+    же (prefix/ab/abcd….jpg), поэтому их ищет одна выборка по первичному
+    ключу ImageBlob.
+    """
+    digests = {name: variant_digest(name) for name in names}
+    lookups = [
+        # Все расширения одной картинки: от «digest.» до «digest/».
+        Q(name__gte=f'{prefix}/{digest[:2]}/{digest}.',
+          name__lt=f'{prefix}/{digest[:2]}/{digest}/')
+        for digest in set(digests.values()) if digest is not None
+    ]
+    if not lookups:
+        return set()
+    found = {
+        os.path.splitext(os.path.basename(blob))[0]
+        for blob in ImageBlob.objects.filter(
+            reduce(or_, lookups)).values_list('name', flat=True)
+    }
+    return {name for name, digest in digests.items() if digest in found}
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из каталога картинок постов файлы, на которые больше '
+        'ничего не ссылается, вместе с их миниатюрами sorl. Обходит '
+        'каталог потоком, проверяет файлы порциями, ограничивает число '
+        'файлов в секунду и продолжает с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов проверять одним запросом.'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=200,
+            help='Сколько файлов в секунду просматривать, не больше.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help=(
+                'Не трогать файлы моложе стольких секунд: пост с такой '
+                'картинкой может быть ещё не сохранён.'
+            )
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(
+                tempfile.gettempdir(), 'yatube', 'collect_media.state'),
+            help='Файл, где хранится путь, на котором остановился обход.'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать обход сначала, не глядя на сохранённый путь.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы удалено.'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.storage = Post._meta.get_field('image').storage
+        upload_to = Post._meta.get_field('image').upload_to
+        self.prefix = upload_to.rstrip('/')
+        root = self.storage.path(self.prefix)
+        if not os.path.isdir(root):
+            return
+        checkpoint = options['checkpoint']
+        after = ()
+        if not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                after = tuple(checkpoint_file.read().strip().split('/'))
+        self.legacy_variants = legacy_variants(self.prefix)
+        self.scanned = self.removed = self.freed = 0
+        self.started = time.monotonic()
+        self.min_mtime = time.time() - options['min_age']
+        batch = []
+        for path, entry in walk(root, after=after):
+            batch.append((path, entry))
+            if len(batch) >= options['batch_size']:
+                self.collect(batch)
+                self.save_checkpoint(batch[-1][0])
+                batch = []
+        if batch:
+            self.collect(batch)
+        if os.path.exists(checkpoint) and not options['dry_run']:
+            os.remove(checkpoint)
+        self.stdout.write(
+            f'Просмотрено файлов: {self.scanned}, удалено: {self.removed}, '
+            f'освобождено {self.freed} байт.'
+        )
+
+    def collect(self, batch):
+        files = {}
+        for path, entry in batch:
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime <= self.min_mtime:
+                name = '/'.join([self.prefix] + path.split(os.sep))
+                files[name] = stat.st_size
+        variants_prefix = f'{self.prefix}/{VARIANTS_DIRECTORY}/'
+        images = [
+            name for name in files if not name.startswith(variants_prefix)]
+        variants = [
+            name for name in files if name.startswith(variants_prefix)]
+        orphans = []
+        if images:
+            referenced = referenced_images(images)
+            orphans += [
+                (name, True) for name in images if name not in referenced]
+        if variants:
+            referenced = referenced_variants(variants, self.prefix)
+            referenced |= self.legacy_variants & set(variants)
+            orphans += [
+                (name, False) for name in variants if name not in referenced]
+        for name, is_image in orphans:
+            self.stdout.write(f'Лишний файл: {name}')
+            if self.options['dry_run']:
+                continue
+            if is_image:
+                # Вместе с файлом sorl удалит миниатюры и записи о них.
+                delete(ImageFile(name, storage=self.storage))
+            else:
+                default_storage.delete(name)
+            self.removed += 1
+            self.freed += files[name]
+        self.scanned += len(batch)
+        # Не быстрее rate файлов в секунду с начала обхода.
+        delay = (
+            self.started + self.scanned / self.options['rate']
+            - time.monotonic()
+        )
+        if delay > 0:
+            time.sleep(delay)
+
+    def save_checkpoint(self, path):
+        if self.options['dry_run']:
+            return
+        checkpoint = self.options['checkpoint']
+        os.makedirs(os.path.dirname(checkpoint) or '.', exist_ok=True)
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write('/'.join(path.split(os.sep)))
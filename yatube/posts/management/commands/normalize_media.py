@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import blobs, images
+from posts.models import Post
+
+
+def normalize_chunk(image_names):
+    """
+    Нормализует порцию картинок и переводит посты на новые файлы.
+    Возвращает размер в байтах до и после и число ошибок.
+    """
+    field = Post._meta.get_field('image')
+    storage = field.storage
+    before = after = failed = 0
+    for image_name in image_names:
+        try:
+            with storage.open(image_name) as image_file:
+                data = image_file.read()
+            normalized = images.normalize(data)
+            before += len(data)
+            if normalized is None:
+                after += len(data)
+                continue
+            # Новое содержимое -- новое имя в хранилище по хешу.
+            saved_name = storage.save(
+                field.upload_to + os.path.basename(image_name),
+                ContentFile(normalized)
+            )
+            blobs.move(image_name, saved_name)
+            after += len(normalized)
+        except OSError:
+            failed += 1
+    connections.close_all()
+    return before, after, failed
+
+
+class Command(BaseCommand):
+    help = (
+        'Нормализует уже загруженные картинки постов в нескольких '
+        'процессах: поворот по EXIF, удаление метаданных, уменьшение и '
+        'пересжатие. Сообщает, сколько места освобождено.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов нормализуют картинки.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20,
+            help='Сколько картинок отдавать процессу за раз.'
+        )
+
+    def handle(self, *args, **options):
+        image_names = list(
+            Post.objects.exclude(image='').order_by(
+                'image'
+            ).values_list('image', flat=True).distinct()
+        )
+        chunk_size = options['chunk_size']
+        chunks = [
+            image_names[start:start + chunk_size]
+            for start in range(0, len(image_names), chunk_size)
+        ]
+        # Дочерние процессы не должны делить соединение с базой родителя.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            results = list(executor.map(normalize_chunk, chunks))
+        before = sum(result[0] for result in results)
+        after = sum(result[1] for result in results)
+        failed = sum(result[2] for result in results)
+        self.stdout.write(
+            f'Картинок: {len(image_names)}, с ошибками: {failed}. '
+            f'Было {before} байт, стало {after}, '
+            f'освобождено {before - after}.'
+        )
@@ -0,0 +1,81 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def generate_chunk(posts):
+    """Создаёт варианты картинок порции постов, возвращает id с ошибками."""
+    failed = []
+    for post_id, image_name in posts:
+        try:
+            thumbnails.generate(post_id, image_name)
+        except Exception:
+            logger.exception(
+                'Не удалось создать варианты картинки %s поста %s',
+                image_name, post_id
+            )
+            failed.append(post_id)
+    connections.close_all()
+    return failed
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт варианты картинок постов, у которых их ещё нет, '
+        'в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов создают варианты.'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать варианты и у постов, где они уже есть.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50,
+            help='Сколько картинок отдавать процессу за раз.'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_variants='')
+        posts = list(posts.order_by('pk').values_list('pk', 'image'))
+        chunk_size = options['chunk_size']
+        chunks = [
+            posts[start:start + chunk_size]
+            for start in range(0, len(posts), chunk_size)
+        ]
+        # Дочерние процессы не должны делить соединение с базой родителя.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            failed = [
+                post_id
+                for chunk_failed in executor.map(generate_chunk, chunks)
+                for post_id in chunk_failed
+            ]
+        self.stdout.write(
+            f'Постов с картинками: {len(posts)}, с ошибками: {len(failed)}')
+        if failed:
+            self.stderr.write(
+                'Посты с ошибками: ' + ', '.join(map(str, failed)))
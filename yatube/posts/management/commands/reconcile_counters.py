@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет хранимые счётчики постов, комментариев и подписок '
+        'с реальными данными и исправляет расхождения порциями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк сверять за одну транзакцию.'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for pks in self.chunks(User.objects.all(), chunk_size):
+            counters.create_missing_user_stats(pks)
+        for name, (model, fields) in counters.COUNTERS.items():
+            fixed = 0
+            for pks in self.chunks(model.objects.all(), chunk_size):
+                with transaction.atomic():
+                    fixed += counters.reconcile_chunk(model, fields, pks)
+            self.stdout.write(f'{name}: исправлено строк {fixed}')
+
+    @staticmethod
+    def chunks(queryset, chunk_size):
+        """Идёт по первичному ключу порциями, без OFFSET."""
+        last_pk = None
+        while True:
+            page = queryset.order_by('pk')
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            pks = list(page.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
@@ -0,0 +1,89 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Заполняет ленты подписок для уже существующих подписок."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    for follow in Follow.objects.all().iterator():
+        recent_posts = Post.objects.filter(
+            author_id=follow.author_id
+        ).order_by('-pub_date', '-pk').values_list('pk', 'pub_date')
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=follow.user_id,
+                    author_id=follow.author_id,
+                    post_id=post_id,
+                    pub_date=pub_date,
+                )
+                for post_id, pub_date
+                in recent_posts[:settings.TIMELINE_BACKFILL_SIZE]
+            ),
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_auto_20220207_1335'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('pub_date', models.DateTimeField(
+                    verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+',
+                    to=settings.AUTH_USER_MODEL,
+                    verbose_name='Автор'
+                )),
+                ('post', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='timeline_entries',
+                    to='posts.Post',
+                    verbose_name='Пост'
+                )),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='timeline',
+                    to=settings.AUTH_USER_MODEL,
+                    verbose_name='Читатель'
+                )),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Лента подписок',
+                'ordering': ['-pub_date', '-post'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_of(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('*')
+            ).values('total'),
+            output_field=models.IntegerField()
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики по уже существующим данным."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.bulk_create(
+        UserStats(user_id=pk)
+        for pk in User.objects.values_list('pk', flat=True)
+    )
+    UserStats.objects.update(
+        posts_count=count_of(Post, 'author'),
+        followers_count=count_of(Follow, 'author'),
+        following_count=count_of(Follow, 'user'),
+    )
+    Group.objects.update(posts_count=count_of(Post, 'group'))
+    Post.objects.update(comments_count=count_of(Comment, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='stats',
+                    serialize=False,
+                    to=settings.AUTH_USER_MODEL,
+                    verbose_name='Пользователь'
+                )),
+                ('posts_count', models.IntegerField(
+                    default=0, verbose_name='Число постов')),
+                ('followers_count', models.IntegerField(
+                    default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.IntegerField(
+                    default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.IntegerField(
+                default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(
+                default=0,
+                editable=False,
+                verbose_name='Число комментариев'
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_updated(apps, schema_editor):
+    """Для уже существующих постов берёт дату публикации."""
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name='Дата изменения'
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from posts import search
+
+
+def create_index(apps, schema_editor):
+    search.install_index(schema_editor.connection)
+
+
+def remove_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_image_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, remove_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:04
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """
+    Оставляет по одной подписке на пару (подписчик, автор) и исправляет
+    счётчики затронутых пользователей.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = Follow.objects.values('user_id', 'author_id').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for row in list(duplicates):
+        Follow.objects.filter(
+            user_id=row['user_id'], author_id=row['author_id']
+        ).exclude(id=row['first_id']).delete()
+        UserStats.objects.filter(user_id=row['user_id']).update(
+            following_count=Follow.objects.filter(
+                user_id=row['user_id']).count()
+        )
+        UserStats.objects.filter(user_id=row['author_id']).update(
+            followers_count=Follow.objects.filter(
+                author_id=row['author_id']).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='follow',
+            name='follow_user_author_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='follow_unique_user_author'),
+        ),
+    ]
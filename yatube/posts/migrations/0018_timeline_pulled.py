@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_authors(apps, schema_editor):
+    """Отмечает авторов, которые уже читаются при запросе ленты."""
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD
+    ).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_follow_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, verbose_name='Посты читаются при запросе ленты'),
+        ),
+        migrations.RunPython(
+            mark_pulled_authors, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,15 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db import models
 
 from core.models import CreatedModel
 
+from . import images
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -10,6 +17,11 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.IntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -19,6 +31,35 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводят шаблоны лент (article.html, profile.html).
+    FEED_FIELDS = (
+        'text',
+        'pub_date',
+        'updated',
+        'image',
+        'image_width',
+        'image_height',
+        'image_variants',
+        'comments_count',
+        'author',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group',
+        'group__title',
+        'group__slug',
+    )
+
+    def feed(self):
+        """
+        Посты, готовые для ленты: автор и группа подтягиваются одним JOIN,
+        число комментариев хранится в самом посте, из базы читаются только
+        нужные шаблонам колонки.
+        """
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -28,6 +69,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -46,17 +91,106 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False,
+        help_text='JSON: список вариантов с форматом, размерами и файлом'
+    )
+    comments_count = models.IntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def responsive_image(self):
+        """
+        Всё, что нужно тегу <img> с srcset, без обращения к файлам:
+        srcset по форматам, запасной src и размеры самого большого
+        варианта. None, пока варианты картинки не созданы.
+        """
+        try:
+            variants = json.loads(self.image_variants)
+            srcset = {}
+            for variant in variants:
+                srcset.setdefault(variant['format'], []).append(
+                    f"{default_storage.url(variant['name'])} "
+                    f"{variant['width']}w"
+                )
+            largest = max(
+                (variant for variant in variants
+                 if variant['format'] == 'jpeg'),
+                key=lambda variant: variant['width']
+            )
+        except (ValueError, TypeError, KeyError):
+            # Пусто, пока варианты не созданы, или испорчено вручную.
+            return None
+        return {
+            'webp': ', '.join(srcset.get('webp', [])),
+            'jpeg': ', '.join(srcset['jpeg']),
+            'src': default_storage.url(largest['name']),
+            'width': largest['width'],
+            'height': largest['height'],
+        }
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            # Новая загрузка ещё не записана в хранилище: записываем уже
+            # нормализованную картинку.
+            self.image.seek(0)
+            normalized = images.normalize(self.image.read())
+            self.image.seek(0)
+            if normalized is not None:
+                self.image.file = ContentFile(normalized)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа на момент загрузки нужна, чтобы при смене группы
+        # поправить счётчики постов у старой и новой группы.
+        instance._loaded_group_id = instance.__dict__.get('group_id')
+        # Прежняя картинка нужна, чтобы отпустить ссылку на её файл.
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
 
 class Comment(CreatedModel):
     post = models.ForeignKey(
@@ -80,6 +214,11 @@ class Comment(CreatedModel):
         ordering = ['created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['created'], name='comment_created_idx'),
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -98,3 +237,102 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='follow_unique_user_author'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Хранимые счётчики пользователя, чтобы страницы не считали COUNT(*).
+    Поддерживаются сигналами при создании и удалении постов и подписок,
+    расхождения исправляет команда reconcile_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.IntegerField('Число постов', default=0)
+    followers_count = models.IntegerField('Число подписчиков', default=0)
+    following_count = models.IntegerField('Число подписок', default=0)
+    timeline_pulled = models.BooleanField(
+        'Посты читаются при запросе ленты', default=False)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class ImageBlob(models.Model):
+    """
+    Число постов, которые ссылаются на файл картинки. Одинаковые
+    загрузки хранятся одним файлом, и удалять его можно, только когда
+    ссылок не осталось.
+    """
+    name = models.CharField('Файл', max_length=255, primary_key=True)
+    refs = models.IntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись в ленте подписок читателя: пост автора, на которого он подписан.
+    Лента заполняется при публикации поста (fan-out on write), поэтому
+    страница подписок читается одним диапазоном индекса по читателю.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Лента подписок'
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
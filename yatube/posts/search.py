@@ -0,0 +1,217 @@
+import base64
+import binascii
+import re
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import CURSOR_SEPARATOR, cursor_page
+
+INDEX_TABLE = 'posts_post_fts'
+TRIGGERS = {
+    'posts_post_fts_insert': (
+        'AFTER INSERT ON posts_post BEGIN '
+        'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+    'posts_post_fts_delete': (
+        'AFTER DELETE ON posts_post BEGIN '
+        "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        'END'
+    ),
+    'posts_post_fts_update': (
+        'AFTER UPDATE OF text ON posts_post BEGIN '
+        "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+}
+# Границы совпадений в отрывке: управляющие символы, которых нет в
+# тексте, чтобы экранировать отрывок целиком и только потом вставить
+# разметку.
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 24
+WORD_RE = re.compile(r'\w+')
+
+
+def install_index(connection):
+    """
+    Создаёт индекс FTS5 над posts_post.text и триггеры, которые держат
+    его в актуальном состоянии при создании, правке и удалении постов,
+    и заполняет индекс по таблице постов.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+            "text, content='posts_post', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for name, definition in TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {definition}')
+        cursor.execute(
+            f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}) VALUES ('rebuild')")
+
+
+def restore_index(connection):
+    """
+    Возвращает триггеры индекса, если их нет: SQLite удаляет триггеры
+    вместе с таблицей, а миграции, меняющие поля, пересоздают posts_post.
+    Пока индекса нет совсем (миграция не применена), ничего не делает.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f'{INDEX_TABLE}%']
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+    if INDEX_TABLE in existing and not set(TRIGGERS) <= existing:
+        install_index(connection)
+
+
+def drop_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+
+def match_expression(query):
+    """
+    Запрос FTS5 из слов строки поиска: все слова должны найтись, последнее
+    -- и как начало слова. Операторы FTS5 из строки не проходят, поэтому
+    синтаксической ошибки в запросе не бывает. Пустая строка -- если
+    слов нет.
+    """
+    words = WORD_RE.findall(query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}{CURSOR_SEPARATOR}{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def row_cursor(row):
+    """Курсор строки (id, ранг, отрывок) из matching_rows."""
+    return encode_cursor(row[1], row[0])
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = raw.decode().split(CURSOR_SEPARATOR)
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>').replace(
+            MARK_END, '</mark>')
+    )
+
+
+def matching_rows(expression, key, forward, limit, using='default'):
+    """
+    Строки (id, ранг, отрывок) найденных постов по возрастанию ранга
+    bm25 (лучшие первыми) строго после ключа (ранг, id) или, если
+    forward ложно, строго до него в обратном порядке.
+    """
+    sql = (
+        f'SELECT rowid, rank, snippet({INDEX_TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, expression]
+    if key is not None:
+        sign = '>' if forward else '<'
+        sql += f' AND (rank {sign} %s OR (rank = %s AND rowid {sign} %s))'
+        params += [key[0], key[0], key[1]]
+    order = '' if forward else ' DESC'
+    sql += f' ORDER BY rank{order}, rowid{order} LIMIT %s'
+    params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_posts(query, per_page, after=None, before=None):
+    """
+    Страница найденных постов, лучшие совпадения первыми. У каждого поста
+    есть search_snippet -- отрывок текста с совпадениями в <mark>.
+    Страницы листаются курсорами по ключу (ранг, id), как ленты.
+    """
+    expression = match_expression(query)
+    limit = per_page + 1
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after)
+    rows = []
+    if expression and before_key is not None:
+        rows = matching_rows(expression, before_key, False, limit)
+        has_more = len(rows) == limit
+        rows = rows[:per_page][::-1]
+        previous_cursor = row_cursor(rows[0]) if has_more else None
+        next_cursor = (
+            row_cursor(rows[-1]) if rows
+            else encode_cursor(*before_key)
+        )
+        cursor = f'before:{before}'
+    else:
+        if expression:
+            rows = matching_rows(expression, after_key, True, limit)
+        has_more = len(rows) == limit
+        rows = rows[:per_page]
+        next_cursor = row_cursor(rows[-1]) if has_more else None
+        previous_cursor = None
+        cursor = ''
+        if after_key is not None:
+            previous_cursor = (
+                row_cursor(rows[0]) if rows
+                else encode_cursor(*after_key)
+            )
+            cursor = f'after:{after}'
+    posts = Post.objects.feed().in_bulk([row[0] for row in rows])
+    object_list = []
+    for pk, rank, snippet in rows:
+        if pk in posts:
+            post = posts[pk]
+            post.search_snippet = highlight(snippet)
+            object_list.append(post)
+    return cursor_page(
+        object_list, Paginator(object_list, per_page), cursor=cursor,
+        next_cursor=next_cursor, previous_cursor=previous_cursor
+    )
+
+
+def filter_posts(queryset, query):
+    """
+    Посты queryset, текст которых содержит все слова query. Фильтр
+    работает через индекс FTS5, а не через LIKE по всей таблице.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s',
+        [expression]
+    ))
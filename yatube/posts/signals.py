@@ -0,0 +1,142 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import blobs, caching, counters, follows, search, timeline
+from .models import Comment, Follow, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+# Сбрасывать кеш лент нужно до count_saved_post: тот запоминает новую
+# группу поста, а здесь нужна и прежняя.
+@receiver(post_save, sender=Post)
+def bump_saved_post_feeds(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    feeds = caching.post_feeds(instance.author_id, instance.group_id)
+    feeds.append(caching.post_page(instance.pk))
+    if created:
+        feeds.append(caching.author_stats(instance.author_id))
+    loaded_group_id = getattr(instance, '_loaded_group_id', None)
+    if loaded_group_id is not None:
+        feeds.append(caching.group_feed(loaded_group_id))
+    caching.bump_generations(feeds)
+
+
+@receiver(post_delete, sender=Post)
+def bump_deleted_post_feeds(sender, instance, **kwargs):
+    caching.bump_generations([
+        *caching.post_feeds(instance.author_id, instance.group_id),
+        caching.post_page(instance.pk),
+        caching.author_stats(instance.author_id),
+    ])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_commented_post_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        post = instance.post
+    except Post.DoesNotExist:
+        return
+    caching.bump_generations([
+        *caching.post_feeds(post.author_id, post.group_id),
+        caching.post_page(post.pk),
+    ])
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded_group_id = getattr(instance, '_loaded_group_id', None)
+    if created:
+        counters.shift_user(instance.author_id, posts_count=1)
+        counters.shift_group(instance.group_id, 1)
+        caching.shift_counts(
+            caching.post_feeds(instance.author_id, instance.group_id), 1)
+    elif loaded_group_id != instance.group_id:
+        counters.shift_group(loaded_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+        if loaded_group_id is not None:
+            caching.shift_counts([caching.group_feed(loaded_group_id)], -1)
+        if instance.group_id is not None:
+            caching.shift_counts([caching.group_feed(instance.group_id)], 1)
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, posts_count=-1)
+    counters.shift_group(instance.group_id, -1)
+    caching.shift_counts(
+        caching.post_feeds(instance.author_id, instance.group_id), -1)
+    caching.forget_counts(
+        caching.follow_feed(user_id)
+        for user_id in follows.follower_ids(instance.author_id)
+    )
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        # Правка комментария не меняет их число, но пост всё равно
+        # отмечается изменённым.
+        counters.shift_post(instance.post_id, 1 if created else 0)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.shift_post(instance.post_id, -1)
+
+
+# Подписки из представлений идут через follows.follow и follows.unfollow
+# мимо сигналов; эти обработчики нужны для админки и прочих записей
+# через ORM.
+@receiver(post_save, sender=Follow)
+def apply_saved_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.followed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def apply_deleted_follow(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follower_ids = timeline.fan_out_post(instance)
+        caching.forget_counts(
+            caching.follow_feed(user_id) for user_id in follower_ids)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded_image = None if created else getattr(
+        instance, '_loaded_image', None)
+    if instance.image.name != loaded_image:
+        blobs.acquire(instance.image.name)
+        blobs.release(loaded_image)
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_post_image(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using='default', **kwargs):
+    if sender.name == 'posts':
+        search.restore_index(connections[using])
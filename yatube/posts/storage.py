@@ -0,0 +1,56 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Называет файлы по SHA-256 содержимого: posts/ab/abcd….jpg. Одинаковые
+    загрузки получают одно имя и один файл на диске, а значит, и один
+    набор миниатюр sorl. Файлы с таким именем не перезаписываются и не
+    переименовываются: содержимое у них и так одинаковое. Удалять файл
+    можно, только когда на него не осталось ссылок (см. posts.blobs).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(
+            directory, digest[:2], digest + extension).replace('\\', '/')
+        full_path = self.path(name)
+        try:
+            # Файл уже есть: свежее время изменения не даст blobs.collect
+            # удалить его, пока пост с этой загрузкой не взял ссылку.
+            os.utime(full_path)
+        except FileNotFoundError:
+            pass
+        else:
+            return name
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл рядом и переименовываем: параллельная
+        # загрузка того же содержимого не увидит недописанный файл.
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(full_path))
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                for chunk in content.chunks():
+                    temporary_file.write(chunk)
+            # mkstemp создаёт файл с правами 0600.
+            os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+            os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return name
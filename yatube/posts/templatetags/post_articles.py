@@ -0,0 +1,41 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from ..kvstore import preload_thumbnails
+
+register = template.Library()
+
+ARTICLE_TEMPLATE = 'posts/includes/article.html'
+
+
+def article_key(template_name, post):
+    return (
+        f'article:{template_name}:{post.pk}:'
+        f'{post.updated.timestamp()}'
+    )
+
+
+@register.simple_tag
+def cached_articles(posts, template_name=ARTICLE_TEMPLATE):
+    """
+    Возвращает пары (пост, готовый HTML поста). Отрисовки берутся из кеша
+    одним get_many; ключ содержит дату изменения поста, поэтому правка
+    поста или его комментариев сама выбирает новую запись кеша.
+    Недостающие посты отрисовываются и сохраняются одним set_many, а
+    записи об их миниатюрах заранее загружаются в память одним запросом.
+    """
+    keys = {article_key(template_name, post): post for post in posts}
+    articles = cache.get_many(keys)
+    preload_thumbnails(
+        post for key, post in keys.items() if key not in articles)
+    missing = {
+        key: render_to_string(template_name, {'post': post})
+        for key, post in keys.items() if key not in articles
+    }
+    if missing:
+        cache.set_many(missing, settings.FRAGMENT_CACHE_TIMEOUT)
+        articles.update(missing)
+    return [(post, mark_safe(articles[key])) for key, post in keys.items()]
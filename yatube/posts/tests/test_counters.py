@@ -0,0 +1,94 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post, User, UserStats
+
+TEST_USERNAME = 'test-user'
+TEST_FOLLOWER_USERNAME = 'test-follower-user'
+TEST_POST_TEXT = 'Тестовый текст поста'
+TEST_COMMENT_TEXT = 'Тестовый текст комментария'
+TEST_GROUP_TITLE = 'Тестовая группа'
+TEST_GROUP_SLUG = 'test-slug'
+TEST_SECOND_GROUP_SLUG = 'test-slug-2'
+TEST_GROUP_DESCRIPTION = 'Тестовое описание группы'
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=TEST_USERNAME)
+        cls.follower = User.objects.create_user(
+            username=TEST_FOLLOWER_USERNAME)
+        cls.group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=TEST_GROUP_SLUG,
+            description=TEST_GROUP_DESCRIPTION,
+        )
+        cls.second_group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=TEST_SECOND_GROUP_SLUG,
+            description=TEST_GROUP_DESCRIPTION,
+        )
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            with self.subTest(obj=obj, field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев следуют за созданием и удалением."""
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=CountersTest.user,
+            group=CountersTest.group
+        )
+        comment = Comment.objects.create(
+            post=post, author=CountersTest.user, text=TEST_COMMENT_TEXT)
+        self.assertCounters(post, comments_count=1)
+        self.assertCounters(CountersTest.group, posts_count=1)
+        self.assertCounters(CountersTest.user.stats, posts_count=1)
+        comment.delete()
+        self.assertCounters(post, comments_count=0)
+        post.delete()
+        self.assertCounters(CountersTest.group, posts_count=0)
+        self.assertCounters(CountersTest.user.stats, posts_count=0)
+
+    def test_changing_group_moves_post_count(self):
+        """При смене группы пост переходит в счётчик новой группы."""
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=CountersTest.user,
+            group=CountersTest.group
+        )
+        post = Post.objects.get(pk=post.pk)
+        post.group = CountersTest.second_group
+        post.save()
+        self.assertCounters(CountersTest.group, posts_count=0)
+        self.assertCounters(CountersTest.second_group, posts_count=1)
+
+    def test_follow_counters(self):
+        """Счётчики подписок и подписчиков следуют за подпиской."""
+        follow = Follow.objects.create(
+            user=CountersTest.follower, author=CountersTest.user)
+        self.assertCounters(CountersTest.user.stats, followers_count=1)
+        self.assertCounters(CountersTest.follower.stats, following_count=1)
+        follow.delete()
+        self.assertCounters(CountersTest.user.stats, followers_count=0)
+        self.assertCounters(CountersTest.follower.stats, following_count=0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=CountersTest.user,
+            group=CountersTest.group
+        )
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        Group.objects.filter(pk=CountersTest.group.pk).update(posts_count=7)
+        UserStats.objects.filter(user=CountersTest.follower).delete()
+        call_command('reconcile_counters', chunk_size=1, stdout=StringIO())
+        self.assertCounters(post, comments_count=0)
+        self.assertCounters(CountersTest.group, posts_count=1)
+        self.assertTrue(
+            UserStats.objects.filter(user=CountersTest.follower).exists())
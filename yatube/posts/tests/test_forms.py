@@ -1,13 +1,25 @@
+import hashlib
+import json
+import os
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
+from PIL import Image
 
+from jobs import queue
+
+from .. import blobs, caching, thumbnails
 from ..forms import CommentForm, PostForm
-from ..models import Comment, Post, User
+from ..models import Comment, ImageBlob, Post, User
+from .utils import committed
 
 TEST_USERNAME = 'test-user'
 TEST_POST_TEXT = 'Тестовый текст поста'
@@ -20,10 +32,15 @@ TEST_IMAGE = (
     b'\x00\x00\x01\x00\x01\x00\x00\x02'
     b'\x02\x4c\x01\x00\x3b'
 )
+# Картинки хранятся под именем по хешу содержимого.
+TEST_IMAGE_HASH = hashlib.sha256(TEST_IMAGE).hexdigest()
+TEST_IMAGE_NAME = f'posts/{TEST_IMAGE_HASH[:2]}/{TEST_IMAGE_HASH}.gif'
+ORIENTATION_TAG = 0x0112
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_COLLECT_MIN_AGE=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -71,7 +88,7 @@ class PostFormTests(TestCase):
             Post.objects.filter(
                 text=TEST_POST_TEXT,
                 author=PostFormTests.user,
-                image='posts/small.gif'
+                image=TEST_IMAGE_NAME
             ).exists()
         )
 
@@ -107,10 +124,238 @@ class PostFormTests(TestCase):
             Post.objects.filter(
                 text=TEST_POST_NEW_TEXT,
                 author=PostFormTests.user,
-                image='posts/very_small.gif'
+                image=TEST_IMAGE_NAME
             ).exists()
         )
 
+    def test_oversized_uploads_rejected_with_form_error(self):
+        """
+        Слишком тяжёлый файл или картинка со слишком большим числом
+        пикселей не сохраняются, а форма показывает ошибку.
+        """
+        limits = {
+            'Файл слишком большой': {'POST_IMAGE_MAX_BYTES': 10},
+            'Картинка слишком большая': {'POST_IMAGE_MAX_PIXELS': 0},
+        }
+        post_count = Post.objects.count()
+        for error, limit in limits.items():
+            with self.subTest(error=error), override_settings(**limit):
+                uploaded = SimpleUploadedFile(
+                    name='small.gif',
+                    content=TEST_IMAGE,
+                    content_type='image/gif'
+                )
+                response = self.authorized_client.post(
+                    reverse('posts:post_create'),
+                    data={'text': TEST_POST_TEXT, 'image': uploaded}
+                )
+                self.assertEqual(Post.objects.count(), post_count)
+                self.assertIn(
+                    error, response.context['form'].errors['image'][0])
+
+    def test_post_create_still_checks_csrf(self):
+        """Замена обработчиков загрузки не отключает проверку CSRF."""
+        csrf_client = Client(enforce_csrf_checks=True)
+        csrf_client.force_login(PostFormTests.user)
+        response = csrf_client.post(
+            reverse('posts:post_create'), data={'text': TEST_POST_TEXT})
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.filter(text=TEST_POST_TEXT).exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=200)
+    def test_uploaded_image_normalized(self):
+        """
+        Загруженная картинка повёрнута по EXIF, уменьшена и сохранена
+        без метаданных.
+        """
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (300, 100)).save(buffer, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': TEST_POST_TEXT, 'image': uploaded}
+        )
+        post = Post.objects.get(text=TEST_POST_TEXT)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (67, 200))
+            self.assertFalse(image.getexif())
+
+    def test_same_image_stored_once_until_unreferenced(self):
+        """
+        Одинаковые картинки хранятся одним файлом, который удаляется,
+        только когда на него не ссылается ни один пост.
+        """
+        posts = [
+            Post.objects.create(
+                text=TEST_POST_TEXT,
+                author=PostFormTests.user,
+                image=SimpleUploadedFile(name, TEST_IMAGE, 'image/gif')
+            )
+            for name in ('first.gif', 'second.gif')
+        ]
+        self.assertEqual(
+            {post.image.name for post in posts}, {TEST_IMAGE_NAME})
+        self.assertEqual(ImageBlob.objects.get(name=TEST_IMAGE_NAME).refs, 2)
+        storage = posts[0].image.storage
+        posts[0].delete()
+        blobs.collect(TEST_IMAGE_NAME)
+        self.assertTrue(storage.exists(TEST_IMAGE_NAME))
+        posts[1].image = ''
+        posts[1].save()
+        blobs.collect(TEST_IMAGE_NAME)
+        self.assertFalse(storage.exists(TEST_IMAGE_NAME))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    @override_settings(POST_IMAGE_COLLECT_MIN_AGE=60)
+    def test_reused_image_survives_collect(self):
+        """
+        Файл без ссылок, который только что переиспользовала загрузка
+        того же содержимого, не удаляется до того, как пост возьмёт
+        ссылку на него.
+        """
+        post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=PostFormTests.user,
+            image=SimpleUploadedFile('first.gif', TEST_IMAGE, 'image/gif')
+        )
+        storage = post.image.storage
+        old = os.path.getmtime(storage.path(TEST_IMAGE_NAME)) - 120
+        os.utime(storage.path(TEST_IMAGE_NAME), (old, old))
+        post.delete()
+        # Загрузка того же содержимого до того, как её пост сохранён.
+        storage.save('posts/second.gif', ContentFile(TEST_IMAGE))
+        blobs.collect(TEST_IMAGE_NAME)
+        self.assertTrue(storage.exists(TEST_IMAGE_NAME))
+        Post.objects.create(
+            text=TEST_POST_TEXT, author=PostFormTests.user,
+            image=TEST_IMAGE_NAME
+        )
+        self.assertEqual(ImageBlob.objects.get(name=TEST_IMAGE_NAME).refs, 1)
+
+    def test_same_image_gets_one_variant_set(self):
+        """
+        Одинаковые загрузки делят один набор вариантов картинки, который
+        удаляется вместе с последней ссылкой на файл.
+        """
+        posts = [
+            Post.objects.create(
+                text=TEST_POST_TEXT,
+                author=PostFormTests.user,
+                image=SimpleUploadedFile(name, TEST_IMAGE, 'image/gif')
+            )
+            for name in ('first.gif', 'second.gif')
+        ]
+        for post in posts:
+            thumbnails.generate(post.pk, post.image.name)
+            post.refresh_from_db()
+        self.assertEqual(posts[0].image_variants, posts[1].image_variants)
+        names = {
+            variant['name']
+            for variant in json.loads(posts[0].image_variants)
+        }
+        _, files = default_storage.listdir(thumbnails.VARIANTS_DIRECTORY)
+        self.assertEqual(
+            {
+                f'{thumbnails.VARIANTS_DIRECTORY}/{name}' for name in files
+                if name.startswith(TEST_IMAGE_HASH)
+            },
+            names
+        )
+        for post in posts:
+            post.delete()
+        blobs.collect(TEST_IMAGE_NAME)
+        self.assertFalse(
+            any(default_storage.exists(name) for name in names))
+
+    def test_moved_image_gets_new_variants(self):
+        """
+        Перевод постов на новый файл удаляет варианты старого, сбрасывает
+        их у постов, ставит в очередь новые и сбрасывает кеш страниц.
+        """
+        post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=PostFormTests.user,
+            image=SimpleUploadedFile('small.gif', TEST_IMAGE, 'image/gif')
+        )
+        thumbnails.generate(post.pk, post.image.name)
+        post.refresh_from_db()
+        old_variants = [
+            variant['name']
+            for variant in json.loads(post.image_variants)
+        ]
+        generation = caching.get_generation(caching.post_page(post.pk))
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        new_name = post.image.storage.save(
+            'posts/small.png', ContentFile(buffer.getvalue()))
+        with committed():
+            blobs.move(post.image.name, new_name)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, new_name)
+        self.assertEqual(post.image_variants, '')
+        self.assertIsNone(post.image_width)
+        self.assertFalse(
+            any(default_storage.exists(name) for name in old_variants))
+        self.assertNotEqual(
+            caching.get_generation(caching.post_page(post.pk)), generation)
+        job = queue.claim([thumbnails.generate.queue])
+        self.assertEqual(job.arguments, ([post.pk, new_name], {}))
+        self.assertTrue(queue.run(job))
+        post.refresh_from_db()
+        self.assertEqual(post.image_width, 2)
+        self.assertTrue(post.image_variants)
+
+    def test_collect_media_removes_only_orphans(self):
+        """
+        Команда collect_media удаляет файлы, на которые не ссылается ни
+        один пост, и не трогает картинки постов и их варианты.
+        """
+        post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=PostFormTests.user,
+            image=SimpleUploadedFile('small.gif', TEST_IMAGE, 'image/gif')
+        )
+        storage = post.image.storage
+        # Картинка, сохранённая до хранилища по хешу.
+        legacy_name = 'posts/legacy.png'
+        with open(storage.path(legacy_name), 'wb') as legacy_file:
+            Image.new('RGB', (2, 2)).save(legacy_file, 'PNG')
+        legacy_post = Post.objects.create(
+            text=TEST_POST_TEXT, author=PostFormTests.user, image=legacy_name)
+        variants = []
+        for image_post in (post, legacy_post):
+            thumbnails.generate(image_post.pk, image_post.image.name)
+            image_post.refresh_from_db()
+            variants += [
+                variant['name']
+                for variant in json.loads(image_post.image_variants)
+            ]
+        orphans = [
+            storage.save('posts/orphan.gif', ContentFile(b'orphan')),
+            default_storage.save(
+                'posts/variants/orphan-480.jpg', ContentFile(b'orphan')),
+            default_storage.save(
+                f'posts/variants/{"0" * 64}-480.jpg', ContentFile(b'orphan')),
+        ]
+        call_command(
+            'collect_media',
+            min_age=0,
+            checkpoint=os.path.join(TEMP_MEDIA_ROOT, 'collect_media.state'),
+            stdout=StringIO()
+        )
+        for name in [post.image.name, legacy_name, *variants]:
+            with self.subTest(name=name):
+                self.assertTrue(default_storage.exists(name))
+        for name in orphans:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+
 
 class CommentFormTests(TestCase):
     @classmethod
@@ -0,0 +1,170 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import urls
+from ..models import Comment, Follow, Group, Post, User
+
+TEST_USERNAME = 'test-user'
+TEST_AUTHOR_USERNAME = 'test-author'
+TEST_GROUP_TITLE = 'Тестовая группа'
+TEST_GROUP_SLUG = 'test-slug'
+TEST_GROUP_DESCRIPTION = 'Тестовое описание группы'
+TEST_POST_TEXT = 'Тестовый текст поста'
+TEST_COMMENT_TEXT = 'Тестовый текст комментария'
+FEW_POSTS = 1
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT')
+MANY_POSTS = 25
+
+# Максимум запросов к базе на один ответ страницы, включая сессию
+# и пользователя. Число не должно зависеть от количества постов.
+QUERY_BUDGETS = {
+    'index': 3,
+    'group_list': 4,
+    'profile': 5,
+    'post_detail': 4,
+    'post_edit': 4,
+    'post_create': 3,
+    'add_comment': 3,
+    'follow_index': 4,
+    'profile_follow': 10,
+    'profile_unfollow': 8,
+    'post_search': 4,
+}
+# То же для списков админки: сессия, пользователь, оценка числа строк,
+# строки страницы, группы для редактируемого поля и два запроса
+# навигации по датам.
+ADMIN_QUERY_BUDGETS = {
+    'admin:posts_post_changelist': 7,
+    'admin:posts_comment_changelist': 6,
+}
+
+
+class PagesQueriesTestCase(TestCase):
+    """
+    Пользователь с подпиской, группа и посты для обхода всех страниц из
+    posts/urls.py с записью запросов к базе.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            username=TEST_USERNAME, email='admin@example.com', password='x')
+        cls.author = User.objects.create_user(username=TEST_AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=TEST_GROUP_SLUG,
+            description=TEST_GROUP_DESCRIPTION,
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def create_posts(self, count):
+        for number in range(count):
+            for author in (self.user, self.author):
+                post = Post.objects.create(
+                    text=f'{TEST_POST_TEXT} {number}',
+                    author=author,
+                    group=self.group,
+                )
+                Comment.objects.create(
+                    post=post, author=author, text=TEST_COMMENT_TEXT)
+        return post
+
+    def urls_for(self, post):
+        kwargs = {
+            'group_list': {'slug': TEST_GROUP_SLUG},
+            'profile': {'username': TEST_USERNAME},
+            'post_detail': {'post_id': post.pk},
+            'post_edit': {'post_id': post.pk},
+            'add_comment': {'post_id': post.pk},
+            'profile_follow': {'username': TEST_AUTHOR_USERNAME},
+            'profile_unfollow': {'username': TEST_AUTHOR_USERNAME},
+        }
+        return {
+            pattern.name: reverse(
+                f'{urls.app_name}:{pattern.name}',
+                kwargs=kwargs.get(pattern.name)
+            )
+            for pattern in urls.urlpatterns
+        }
+
+    def capture_queries(self, name, url):
+        """SQL запросов, которые сделала страница name по адресу url."""
+        # Подписка и отписка должны каждый раз действительно менять данные.
+        follow = {
+            'user': self.user,
+            'author': self.author,
+        }
+        if name == 'profile_follow':
+            Follow.objects.filter(**follow).delete()
+        elif name == 'profile_unfollow':
+            Follow.objects.get_or_create(**follow)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(url)
+        # Точки сохранения транзакций тестов не учитываются: вне тестов
+        # на их месте начало и конец транзакции.
+        return [
+            query['sql'] for query in context.captured_queries
+            if not query['sql'].startswith(SAVEPOINT_STATEMENTS)
+        ]
+
+
+class QueryBudgetTest(PagesQueriesTestCase):
+    """
+    Каждая страница из posts/urls.py укладывается в фиксированный бюджет
+    запросов и при одном посте, и при полной странице постов.
+    """
+
+    def count_queries(self, name, url):
+        return len(self.capture_queries(name, url))
+
+    def test_every_url_has_a_budget(self):
+        """У каждого адреса приложения posts задан бюджет запросов."""
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_query_count_does_not_depend_on_posts_count(self):
+        """Число запросов страницы не растёт вместе с числом постов."""
+        post = self.create_posts(FEW_POSTS)
+        few = {
+            name: self.count_queries(name, url)
+            for name, url in self.urls_for(post).items()
+        }
+        post = self.create_posts(MANY_POSTS)
+        many = {
+            name: self.count_queries(name, url)
+            for name, url in self.urls_for(post).items()
+        }
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(url=name):
+                self.assertLessEqual(many[name], budget)
+                self.assertEqual(few[name], many[name])
+
+    def test_admin_query_count_does_not_depend_on_posts_count(self):
+        """
+        Списки постов и комментариев в админке не делают запросов на
+        каждую строку и не считают COUNT(*) по всей таблице.
+        """
+        self.create_posts(FEW_POSTS)
+        few = {
+            name: self.count_queries(name, reverse(name))
+            for name in ADMIN_QUERY_BUDGETS
+        }
+        self.create_posts(MANY_POSTS)
+        many = {
+            name: self.count_queries(name, reverse(name))
+            for name in ADMIN_QUERY_BUDGETS
+        }
+        for name, budget in ADMIN_QUERY_BUDGETS.items():
+            with self.subTest(url=name):
+                self.assertLessEqual(many[name], budget)
+                self.assertEqual(few[name], many[name])
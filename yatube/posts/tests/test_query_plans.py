@@ -0,0 +1,52 @@
+from django.db import connection
+
+from .test_queries import PagesQueriesTestCase
+
+# Строки EXPLAIN QUERY PLAN, которые означают чтение таблицы целиком
+# (в SQLite до 3.36 -- «SCAN TABLE …») или сортировку во временном
+# B-дереве.
+FULL_SCAN = 'SCAN '
+TEMP_SORT = 'USE TEMP B-TREE'
+# Обход индекса по порядку и поиск по FTS5 полным сканированием
+# таблицы не считаются.
+INDEXED_SCAN_MARKERS = (
+    'USING INDEX',
+    'USING COVERING INDEX',
+    'USING INTEGER PRIMARY KEY',
+    'VIRTUAL TABLE',
+)
+# Таблицы, которые читаются целиком намеренно: группы -- варианты выбора
+# в форме поста.
+WHOLE_TABLES = ('posts_group',)
+
+
+def plan_problems(sql):
+    """Строки плана запроса sql с полным сканированием или сортировкой."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    return [
+        detail for detail in details
+        if TEMP_SORT in detail or (
+            detail.startswith(FULL_SCAN)
+            and not any(marker in detail for marker in INDEXED_SCAN_MARKERS)
+            and detail.split()[-1] not in WHOLE_TABLES
+        )
+    ]
+
+
+class QueryPlanTest(PagesQueriesTestCase):
+    """
+    Запросы каждой страницы из posts/urls.py идут по индексам: в их
+    планах нет ни полного сканирования таблицы, ни временной сортировки.
+    """
+
+    def test_pages_use_indexes(self):
+        """Запросы страниц не сканируют таблицы и не сортируют на лету."""
+        post = self.create_posts(2)
+        for name, url in self.urls_for(post).items():
+            for sql in self.capture_queries(name, url):
+                if not sql.startswith('SELECT'):
+                    continue
+                with self.subTest(url=name, sql=sql):
+                    self.assertEqual(plan_problems(sql), [])
@@ -0,0 +1,139 @@
+from django.core.cache import cache
+from django.test import Client, override_settings, TestCase
+from django.urls import reverse
+
+from jobs import queue
+
+from ..models import Follow, Post, TimelineEntry, User
+from .utils import committed
+
+TEST_READER_USERNAME = 'test-reader'
+TEST_SECOND_READER_USERNAME = 'test-second-reader'
+TEST_AUTHOR_USERNAME = 'test-author'
+TEST_POPULAR_AUTHOR_USERNAME = 'test-popular-author'
+
+
+@override_settings(TIMELINE_PULL_THRESHOLD=2)
+class HybridTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username=TEST_READER_USERNAME)
+        cls.second_reader = User.objects.create_user(
+            username=TEST_SECOND_READER_USERNAME)
+        cls.author = User.objects.create_user(username=TEST_AUTHOR_USERNAME)
+        cls.popular_author = User.objects.create_user(
+            username=TEST_POPULAR_AUTHOR_USERNAME)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.popular_author)
+        Follow.objects.create(
+            user=cls.second_reader, author=cls.popular_author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Тестовый пост {number}',
+                author=(
+                    cls.popular_author if number % 2 else cls.author)
+            )
+            for number in range(13)
+        ]
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(HybridTimelineTest.reader)
+        cache.clear()
+
+    def test_popular_author_posts_are_not_fanned_out(self):
+        """Посты популярного автора не раскладываются по лентам читателей."""
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                author=HybridTimelineTest.popular_author).exists())
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                author=HybridTimelineTest.author).exists())
+
+    def test_follow_feed_merges_pushed_and_pulled_posts(self):
+        """
+        Лента подписок сливает посты обоих авторов в порядке публикации
+        и постранично, без пропусков и повторов.
+        """
+        expected = sorted(
+            HybridTimelineTest.posts,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=True
+        )
+        first_page = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        second_page = self.reader_client.get(
+            reverse('posts:follow_index'),
+            {'after': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(first_page) + list(second_page), expected)
+        numbered_page = self.reader_client.get(
+            reverse('posts:follow_index'), {'page': 2}
+        ).context['page_obj']
+        self.assertEqual(numbered_page.paginator.count, len(expected))
+        self.assertEqual(list(numbered_page), expected[10:])
+
+    def test_posts_stay_in_feed_when_author_stops_being_popular(self):
+        """
+        Когда автор опускается ниже порога популярности, фоновая задача
+        раскладывает его посты по лентам оставшихся подписчиков.
+        """
+        popular_posts = [
+            post for post in HybridTimelineTest.posts
+            if post.author == HybridTimelineTest.popular_author
+        ]
+        with committed():
+            Follow.objects.filter(
+                user=HybridTimelineTest.second_reader,
+                author=HybridTimelineTest.popular_author
+            ).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                author=HybridTimelineTest.popular_author).exists())
+        page = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(page.paginator.count, len(HybridTimelineTest.posts))
+        with committed():
+            self.assertTrue(queue.run(queue.claim(['timeline'])))
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=HybridTimelineTest.reader,
+                author=HybridTimelineTest.popular_author
+            ).count(),
+            len(popular_posts)
+        )
+        page = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(page.paginator.count, len(HybridTimelineTest.posts))
+
+    @override_settings(TIMELINE_PUSH_RATIO=0.5)
+    def test_author_stays_pulled_just_below_threshold(self):
+        """
+        Автор, опустившийся чуть ниже порога популярности, остаётся
+        читаемым при запросе: ленты заполняются только ниже push-порога.
+        """
+        with committed():
+            Follow.objects.filter(
+                user=HybridTimelineTest.second_reader,
+                author=HybridTimelineTest.popular_author
+            ).delete()
+        self.assertIsNone(queue.claim(['timeline']))
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                author=HybridTimelineTest.popular_author).exists())
+        page = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(page.paginator.count, len(HybridTimelineTest.posts))
+
+    def test_pulled_post_resets_followers_feed_count(self):
+        """Новый пост популярного автора сбрасывает число постов ленты."""
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url, {'page': 1})
+        with committed():
+            Post.objects.create(
+                text='Новый пост', author=HybridTimelineTest.popular_author)
+        page = self.reader_client.get(url, {'page': 1}).context['page_obj']
+        self.assertEqual(
+            page.paginator.count, len(HybridTimelineTest.posts) + 1)
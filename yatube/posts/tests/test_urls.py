@@ -32,7 +32,8 @@ class PostURLTests(TestCase):
             reverse('posts:group_list', kwargs={'slug': TEST_GROUP_SLUG}),
             reverse('posts:profile', kwargs={'username': TEST_USERNAME}),
             reverse('posts:post_detail', kwargs={
-                'post_id': PostURLTests.post.id})
+                'post_id': PostURLTests.post.id}),
+            reverse('posts:post_search'),
         ]
         cls.pages_templates = {
             reverse('posts:index'): 'posts/index.html',
@@ -48,6 +49,7 @@ class PostURLTests(TestCase):
                 'posts/create_post.html',
             reverse('posts:post_create'): 'posts/create_post.html',
             reverse('posts:follow_index'): 'posts/follow.html',
+            reverse('posts:post_search'): 'posts/search.html',
         }
 
     def setUp(self):
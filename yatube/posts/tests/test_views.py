@@ -4,11 +4,19 @@ import tempfile
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, DatabaseError, transaction
 from django.test import Client, override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
+from sorl.thumbnail import default, get_thumbnail
 
-from ..models import Comment, Follow, Group, Post, User
+from .. import caching, follows, kvstore, search, thumbnails
+from ..management.commands import pregenerate_thumbnails
+from ..models import Comment, Follow, Group, Post, TimelineEntry, User
+from ..templatetags.post_articles import cached_articles
+from .utils import committed
 
 TEST_USERNAME = 'test-user'
 TEST_POST_TEXT = 'Тестовый текст поста'
@@ -85,6 +93,7 @@ class PostViewsTests(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(PostViewsTests.user)
+        cache.clear()
 
     def test_pages_use_correct_templates(self):
         """URL-адреса используют соответствующие шаблоны."""
@@ -196,6 +205,52 @@ class PostViewsTests(TestCase):
         self.assertEqual(
             response.context['post'].image, PostViewsTests.post.image)
 
+    def test_post_image_variants_rendered_with_srcset(self):
+        """
+        После создания вариантов картинки страница поста выводит srcset
+        и размеры картинки.
+        """
+        post = PostViewsTests.post
+        thumbnails.generate(post.pk, post.image.name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'srcset="/media/posts/variants/')
+        self.assertContains(response, 'width="1"')
+
+    def test_failed_pregeneration_is_logged(self):
+        """
+        Ошибка создания вариантов картинки попадает в лог с id поста и
+        именем картинки, id поста возвращается вызывающему.
+        """
+        post = PostViewsTests.post
+        missing_image = 'posts/missing.gif'
+        with self.assertLogs(pregenerate_thumbnails.logger) as logs:
+            failed = pregenerate_thumbnails.generate_chunk(
+                [(post.pk, missing_image)])
+        self.assertEqual(failed, [post.pk])
+        self.assertIn(missing_image, logs.output[0])
+        self.assertIn(str(post.pk), logs.output[0])
+        self.assertIn('Traceback', logs.output[0])
+
+    def test_page_thumbnails_preloaded_in_one_query(self):
+        """
+        Записи о миниатюрах страницы загружаются одним запросом, после
+        чего тег thumbnail находит их в памяти без запросов к базе.
+        """
+        post = PostViewsTests.post
+        thumbnail = get_thumbnail(post.image, '1x1', upscale=False)
+        kvstore.memory.clear()
+        cache.clear()
+        with self.assertNumQueries(1):
+            default.kvstore.preload(
+                [kvstore.thumbnail_key(post.image, '1x1', upscale=False)])
+        with self.assertNumQueries(0):
+            preloaded = get_thumbnail(post.image, '1x1', upscale=False)
+        self.assertEqual(preloaded.name, thumbnail.name)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewsCacheTest(TestCase):
@@ -212,24 +267,158 @@ class PostViewsCacheTest(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(PostViewsCacheTest.user)
+        cache.clear()
 
     def test_template_cached_index_page_show_correct_context(self):
         """
-        Кешированная в шаблоне главная страница показывает новый пост не сразу,
-        но после очистки кеша этот пост появляется на главной странице.
+        Главная страница берётся из кеша, пока посты не меняются, а новый
+        пост сразу сбрасывает кеш и появляется на странице.
         """
-        response_first = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.create(
+        post = Post.objects.create(
             text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+        response_first = self.authorized_client.get(reverse('posts:index'))
+        # update() не шлёт сигналов, поэтому кеш ленты не сбрасывается.
+        Post.objects.filter(pk=post.pk).update(
+            text=TEST_COMMENT_TEXT, updated=timezone.now())
         response_cached = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_first.context, response_cached.context)
         self.assertEqual(response_first.content, response_cached.content)
-        cache.clear()
-        response_cleared = self.authorized_client.get(reverse('posts:index'))
+        with committed():
+            new_post = Post.objects.create(
+                text=TEST_FOLLOWING_POST_TEXT, author=PostViewsCacheTest.user)
+        response_new = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response_new.context['page_obj'][0], new_post)
+        self.assertIn(
+            TEST_FOLLOWING_POST_TEXT, response_new.content.decode())
+        self.assertIn(TEST_COMMENT_TEXT, response_new.content.decode())
+
+    def test_new_comment_refreshes_cached_group_and_profile(self):
+        """Новый комментарий сразу обновляет ленты группы и профиля."""
+        group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=TEST_GROUP_SLUG,
+            description=TEST_GROUP_DESCRIPTION,
+        )
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=PostViewsCacheTest.user, group=group)
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': TEST_GROUP_SLUG}),
+            reverse('posts:profile', kwargs={'username': TEST_USERNAME}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        with committed():
+            Comment.objects.create(
+                post=post, author=PostViewsCacheTest.user,
+                text=TEST_COMMENT_TEXT
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIn('Комментарии: 1', response.content.decode())
+
+    def test_anonymous_pages_are_cached_until_post_changes(self):
+        """
+        Гости получают страницы из кеша; комментарий сбрасывает только
+        страницы своего поста.
+        """
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+        other_post = Post.objects.create(
+            text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+        guest_client = Client()
+        post_url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        other_url = reverse(
+            'posts:post_detail', kwargs={'post_id': other_post.pk})
+        for url in (post_url, other_url):
+            self.assertEqual(guest_client.get(url)['X-Cache'], 'MISS')
+            self.assertEqual(guest_client.get(url)['X-Cache'], 'HIT')
+        with committed():
+            Comment.objects.create(
+                post=post, author=PostViewsCacheTest.user,
+                text=TEST_COMMENT_TEXT
+            )
+        response = guest_client.get(post_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, TEST_COMMENT_TEXT)
+        self.assertEqual(guest_client.get(other_url)['X-Cache'], 'HIT')
+
+    def test_anonymous_page_cached_before_commit_expires(self):
+        """
+        Страница, закешированная для гостя до фиксации нового поста,
+        перестаёт отдаваться из кеша после фиксации.
+        """
+        guest_client = Client()
+        url = reverse('posts:index')
+        guest_client.get(url)
+        with committed():
+            Post.objects.create(
+                text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+            self.assertEqual(guest_client.get(url)['X-Cache'], 'MISS')
+            self.assertEqual(guest_client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(guest_client.get(url)['X-Cache'], 'MISS')
+
+    def test_anonymous_page_key_ignores_unknown_params(self):
+        """
+        Страница для гостя кешируется по пути и параметрам листания,
+        запросы с другими параметрами в кеш не попадают.
+        """
+        guest_client = Client()
+        url = reverse('posts:index')
+        self.assertEqual(
+            guest_client.get(url, {'page': 1})['X-Cache'], 'MISS')
+        self.assertEqual(
+            guest_client.get(url, {'page': 1})['X-Cache'], 'HIT')
+        for number in range(3):
+            with self.subTest(number=number):
+                response = guest_client.get(
+                    url, {'page': 1, 'utm_source': number})
+                self.assertFalse(response.has_header('X-Cache'))
         self.assertEqual(
-            response_cached.context['page_obj'][0],
-            response_cleared.context['page_obj'][0])
-        self.assertNotEqual(response_cached.content, response_cleared.content)
+            guest_client.get(url, {'page': 1})['X-Cache'], 'HIT')
+
+    def test_rendered_article_cached_until_post_changes(self):
+        """
+        Отрисованный пост берётся из кеша, пока не изменились сам пост
+        или его комментарии.
+        """
+        post = Post.objects.create(
+            text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+        posts = Post.objects.feed().filter(pk=post.pk)
+        [(_, first)] = cached_articles(posts)
+        # update() не трогает дату изменения, поэтому кеш не сбрасывается.
+        Post.objects.filter(pk=post.pk).update(text=TEST_COMMENT_TEXT)
+        [(_, cached)] = cached_articles(posts.all())
+        self.assertEqual(first, cached)
+        comment = Comment.objects.create(
+            post=post, author=PostViewsCacheTest.user, text=TEST_COMMENT_TEXT)
+        [(_, commented)] = cached_articles(posts.all())
+        self.assertIn(TEST_COMMENT_TEXT, commented)
+        self.assertIn('Комментарии: 1', commented)
+        comment.delete()
+        [(_, uncommented)] = cached_articles(posts.all())
+        self.assertIn('Комментариев нет', uncommented)
+
+    def test_generations_change_again_after_commit(self):
+        """
+        Поколения лент сдвигаются ещё раз после фиксации записи поста:
+        то, что закешировали до фиксации, устаревает.
+        """
+        feeds = (
+            caching.INDEX_FEED,
+            caching.profile_feed(PostViewsCacheTest.user.pk),
+        )
+        with committed():
+            Post.objects.create(
+                text=TEST_POST_TEXT, author=PostViewsCacheTest.user)
+            generations = caching.get_generations(feeds)
+        for feed, generation in caching.get_generations(feeds).items():
+            with self.subTest(feed=feed):
+                self.assertNotEqual(generation, generations[feed])
+
+    def test_authorized_pages_are_not_cached_whole(self):
+        """Страницы авторизованных пользователей не кешируются целиком."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('X-Cache'))
 
 
 class PaginatorViewsTest(TestCase):
@@ -257,6 +446,7 @@ class PaginatorViewsTest(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(PaginatorViewsTest.user)
+        cache.clear()
 
     def test_first_page_contains_ten_records(self):
         """На первой странице десять постов."""
@@ -276,6 +466,181 @@ class PaginatorViewsTest(TestCase):
                     len(response.context['page_obj']),
                     PaginatorViewsTest.second_page_posts_count)
 
+    def test_cursor_pages_walk_forward_and_back(self):
+        """
+        Курсорная пагинация: по ?after= открывается вторая страница,
+        по ?before= с неё возвращаемся к тем же постам первой страницы.
+        """
+        for page in PaginatorViewsTest.paginator_pages:
+            with self.subTest(page=page):
+                first_page = self.authorized_client.get(
+                    page).context['page_obj']
+                self.assertTrue(first_page.is_cursor)
+                self.assertFalse(first_page.has_previous())
+                second_page = self.authorized_client.get(
+                    page, {'after': first_page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    len(second_page),
+                    PaginatorViewsTest.second_page_posts_count)
+                self.assertFalse(second_page.has_next())
+                back_page = self.authorized_client.get(
+                    page, {'before': second_page.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    list(back_page.object_list), list(first_page.object_list))
+                self.assertFalse(back_page.has_previous())
+
+    def test_numbered_pages_count_is_cached_and_shifted(self):
+        """
+        Число постов ленты берётся из кеша и сдвигается при публикации
+        без повторного COUNT(*).
+        """
+        url = reverse('posts:group_list', kwargs={'slug': TEST_GROUP_SLUG})
+        self.authorized_client.get(url, {'page': 1})
+        with committed():
+            Post.objects.create(
+                text=TEST_POST_TEXT,
+                author=PaginatorViewsTest.user,
+                group=PaginatorViewsTest.group,
+            )
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_client.get(url, {'page': 1})
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            PaginatorViewsTest.total_posts_count + 1)
+        self.assertFalse(
+            any('COUNT' in query['sql'] for query in context.captured_queries))
+
+    def test_rolled_back_post_does_not_shift_count(self):
+        """Откаченная публикация не сдвигает закешированное число постов."""
+        url = reverse('posts:group_list', kwargs={'slug': TEST_GROUP_SLUG})
+        self.authorized_client.get(url, {'page': 1})
+        with committed():
+            try:
+                with transaction.atomic():
+                    Post.objects.create(
+                        text=TEST_POST_TEXT,
+                        author=PaginatorViewsTest.user,
+                        group=PaginatorViewsTest.group,
+                    )
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        response = self.authorized_client.get(url, {'page': 1})
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            PaginatorViewsTest.total_posts_count)
+
+    @override_settings(FEED_COUNT_ESTIMATE=True)
+    def test_estimated_count_uses_stored_counters(self):
+        """В режиме оценки число постов группы берётся из её счётчика."""
+        Group.objects.filter(pk=PaginatorViewsTest.group.pk).update(
+            posts_count=PaginatorViewsTest.total_posts_count)
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_client.get(
+                reverse('posts:group_list', kwargs={'slug': TEST_GROUP_SLUG}),
+                {'page': 1}
+            )
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            PaginatorViewsTest.total_posts_count)
+        self.assertFalse(
+            any('COUNT' in query['sql'] for query in context.captured_queries))
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу ленты."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': 'not-a-cursor'})
+        self.assertEqual(
+            len(response.context['page_obj']),
+            PaginatorViewsTest.first_page_posts_count)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            username=TEST_USERNAME, email='admin@example.com', password='x')
+        cls.posts = [
+            Post.objects.create(text=text, author=cls.user)
+            for text in (
+                'Кошка спит на окне',
+                'Кошка, кошка и ещё одна кошка',
+                'Собака гуляет во дворе',
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:post_search'), {'q': query, **params})
+        return response.context['page_obj']
+
+    def test_search_pages_are_not_cached_whole(self):
+        """Страницы поиска для гостей не попадают в кеш страниц."""
+        for query in ('кошка', 'кошка собака'):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    reverse('posts:post_search'), {'q': query})
+                self.assertFalse(response.has_header('X-Cache'))
+
+    def test_search_ranks_and_highlights_matches(self):
+        """
+        Поиск находит посты по словам, лучшие совпадения идут первыми,
+        найденные слова выделены.
+        """
+        page_obj = self.search('кошка')
+        self.assertEqual(
+            [post.pk for post in page_obj],
+            [SearchViewsTest.posts[1].pk, SearchViewsTest.posts[0].pk]
+        )
+        self.assertIn('<mark>Кошка</mark>', page_obj[0].search_snippet)
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = SearchViewsTest.posts[2]
+        post.text = 'Кошка гуляет во дворе'
+        post.save()
+        self.assertIn(post, list(self.search('кошка')))
+        post.delete()
+        self.assertEqual(len(self.search('дворе')), 0)
+
+    def test_search_escapes_text_and_query(self):
+        """Текст поста в отрывке экранируется, операторы запроса -- нет."""
+        post = Post.objects.create(
+            text='<script>кошка</script>', author=SearchViewsTest.user)
+        page_obj = self.search('"кошка" (')
+        snippet = next(
+            found.search_snippet for found in page_obj if found == post)
+        self.assertIn('&lt;script&gt;<mark>кошка</mark>', snippet)
+
+    def test_search_pages_by_cursor(self):
+        """Следующая страница результатов открывается по курсору."""
+        first_page = search.search_posts('кошка', 1)
+        self.assertTrue(first_page.has_next())
+        second_page = search.search_posts(
+            'кошка', 1, after=first_page.next_cursor)
+        self.assertEqual(
+            [post.pk for post in second_page], [SearchViewsTest.posts[0].pk])
+        self.assertFalse(second_page.has_next())
+        previous_page = search.search_posts(
+            'кошка', 1, before=second_page.previous_cursor)
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты через тот же индекс."""
+        self.client.force_login(SearchViewsTest.user)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собака'})
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            [SearchViewsTest.posts[2]]
+        )
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class FollowViewsTest(TestCase):
@@ -305,6 +670,7 @@ class FollowViewsTest(TestCase):
         self.authorized_follower.force_login(FollowViewsTest.follower)
         self.authorized_following = Client()
         self.authorized_following.force_login(FollowViewsTest.following)
+        cache.clear()
 
     def test_authorized_user_can_follow(self):
         """Авторизованный пользователь может подписываться на других."""
@@ -368,6 +734,55 @@ class FollowViewsTest(TestCase):
         )
         self.assertFalse(response_get_unfollowed_profile.context['following'])
 
+    def test_follow_is_idempotent(self):
+        """
+        Повторная подписка не создаёт второй строки и не сдвигает
+        счётчики, на себя подписаться нельзя.
+        """
+        url = reverse(
+            'posts:profile_follow',
+            kwargs={'username': FollowViewsTest.following}
+        )
+        self.authorized_follower.get(url)
+        self.authorized_follower.get(url)
+        self.authorized_following.get(url)
+        self.assertEqual(
+            list(Follow.objects.values_list('user', 'author')),
+            [(FollowViewsTest.follower.pk, FollowViewsTest.following.pk)]
+        )
+        FollowViewsTest.following.stats.refresh_from_db()
+        self.assertEqual(FollowViewsTest.following.stats.followers_count, 1)
+
+    def test_follow_id_sets_follow_changes(self):
+        """Закешированные множества подписок обновляются при подписке."""
+        follower = FollowViewsTest.follower
+        following = FollowViewsTest.following
+        self.assertEqual(follows.following_ids(follower.pk), set())
+        self.assertEqual(follows.follower_ids(following.pk), set())
+        self.assertTrue(follows.follow(follower, following))
+        self.assertEqual(follows.following_ids(follower.pk), {following.pk})
+        self.assertEqual(follows.follower_ids(following.pk), {follower.pk})
+        self.assertEqual(
+            follows.followed_among(follower, [follower.pk, following.pk]),
+            {following.pk}
+        )
+        self.assertTrue(follows.unfollow(follower, following))
+        self.assertFalse(follows.unfollow(follower, following))
+        self.assertFalse(follows.is_following(follower, following))
+
+    def test_follow_id_set_cached_before_commit_is_dropped(self):
+        """
+        Множество подписок, закешированное до фиксации подписки, после
+        неё читается заново.
+        """
+        follower = FollowViewsTest.follower
+        following = FollowViewsTest.following
+        with committed():
+            follows.follow(follower, following)
+            # Параллельный запрос, не видящий подписки, кеширует старое.
+            cache.set(follows.following_key(follower.pk), frozenset())
+        self.assertEqual(follows.following_ids(follower.pk), {following.pk})
+
     def test_follow_index_page_shows_correct_context_to_a_follower(self):
         """
         Новая запись пользователя появляется в ленте тех, кто на него подписан.
@@ -396,3 +811,31 @@ class FollowViewsTest(TestCase):
         # (no posts, because the author doesn't follow anyone)
         self.assertEqual(
             response_following.context['page_obj'].paginator.count, 0)
+
+    def test_unfollow_removes_author_posts_from_timeline(self):
+        """После отписки посты автора пропадают из ленты подписок."""
+        Follow.objects.create(
+            user=FollowViewsTest.follower, author=FollowViewsTest.following)
+        self.authorized_follower.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': FollowViewsTest.following}
+            )
+        )
+        response = self.authorized_follower.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                user=FollowViewsTest.follower).exists())
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=1)
+    def test_follow_backfills_only_recent_posts(self):
+        """При подписке в ленту попадают только последние посты автора."""
+        newest_post = Post.objects.create(
+            text=TEST_FOLLOWING_POST_TEXT,
+            author=FollowViewsTest.following,
+        )
+        Follow.objects.create(
+            user=FollowViewsTest.follower, author=FollowViewsTest.following)
+        response = self.authorized_follower.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [newest_post])
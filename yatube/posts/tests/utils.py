@@ -0,0 +1,19 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def committed():
+    """
+    Выполняет обработчики transaction.on_commit, добавленные в блоке. Тест
+    в TestCase идёт в транзакции, которая не фиксируется, и сами они не
+    запускаются (в Django 3.2 то же делает captureOnCommitCallbacks).
+    """
+    start = len(connection.run_on_commit)
+    yield
+    while len(connection.run_on_commit) > start:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for _, callback in callbacks:
+            callback()
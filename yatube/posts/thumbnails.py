@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from jobs.queue import task
+
+from .models import Post
+
+# Пропорции картинки в лентах и на странице поста, как у прежней
+# миниатюры 960x339.
+ASPECT = (960, 339)
+# Форматы вариантов: (формат в метаданных, расширение, формат Pillow).
+FORMATS = (
+    ('webp', 'webp', 'WEBP'),
+    ('jpeg', 'jpg', 'JPEG'),
+)
+VARIANTS_DIRECTORY = 'posts/variants'
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def variant_widths(image_width):
+    """Ширины вариантов: не шире оригинала, но хотя бы один вариант."""
+    widths = [
+        width for width in settings.IMAGE_VARIANT_WIDTHS
+        if width <= image_width
+    ]
+    return widths or [image_width]
+
+
+def content_digest(storage, image_name):
+    """
+    SHA-256 содержимого картинки. У файлов ContentAddressedStorage он уже
+    записан в имени, остальные файлы приходится прочитать.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    if DIGEST_RE.match(stem):
+        return stem
+    digest = hashlib.sha256()
+    with storage.open(image_name) as image_file:
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_name(digest, width, extension):
+    return f'{VARIANTS_DIRECTORY}/{digest}-{width}.{extension}'
+
+
+def save_variant(name, content):
+    """
+    Сохраняет вариант под именем name. Если параллельная обработка той
+    же картинки успела раньше, лишняя копия удаляется.
+    """
+    saved_name = default_storage.save(name, content)
+    if saved_name != name:
+        default_storage.delete(saved_name)
+
+
+def build_variants(image_name):
+    """
+    Сохраняет варианты картинки всех ширин в WebP и JPEG, обрезанные
+    до пропорций ленты. Варианты называются по хешу содержимого, поэтому
+    одинаковые картинки разных постов делят один набор, а готовые
+    варианты не создаются заново. Возвращает размеры оригинала и список
+    вариантов.
+    """
+    storage = Post._meta.get_field('image').storage
+    digest = content_digest(storage, image_name)
+    with storage.open(image_name) as image_file:
+        original = Image.open(image_file)
+        original.load()
+    width, height = original.size
+    image = None
+    variants = []
+    for variant_width in variant_widths(width):
+        size = (
+            variant_width,
+            max(1, round(variant_width * ASPECT[1] / ASPECT[0]))
+        )
+        resized = None
+        for name, extension, pillow_format in FORMATS:
+            variant = variant_name(digest, variant_width, extension)
+            if not default_storage.exists(variant):
+                if image is None:
+                    image = original.convert('RGB')
+                if resized is None:
+                    resized = ImageOps.fit(image, size, Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(
+                    buffer,
+                    pillow_format,
+                    quality=settings.IMAGE_VARIANT_QUALITY
+                )
+                save_variant(variant, ContentFile(buffer.getvalue()))
+            variants.append({
+                'format': name,
+                'width': size[0],
+                'height': size[1],
+                'name': variant,
+            })
+    return width, height, variants
+
+
+def delete_variants(image_name):
+    """Удаляет варианты картинки; сам файл картинки должен ещё быть."""
+    storage = Post._meta.get_field('image').storage
+    digest = content_digest(storage, image_name)
+    with storage.open(image_name) as image_file:
+        width = Image.open(image_file).size[0]
+    for variant_width in variant_widths(width):
+        for _, extension, _ in FORMATS:
+            default_storage.delete(
+                variant_name(digest, variant_width, extension))
+
+
+@task(queue='thumbnails')
+def generate(post_id, image_name):
+    """
+    Создаёт варианты картинки поста и записывает их в пост. Если картинку
+    успели заменить, результат для старой не сохраняется.
+    """
+    width, height, variants = build_variants(image_name)
+    post = Post.objects.filter(pk=post_id, image=image_name).first()
+    if post is None:
+        return
+    post.image_width = width
+    post.image_height = height
+    post.image_variants = json.dumps(variants)
+    # Через save, а не update: сигналы сбросят кеш страниц с постом.
+    post.save(update_fields=[
+        'image_width', 'image_height', 'image_variants', 'updated'])
+
+
+def pregenerate(post):
+    """
+    Ставит в очередь создание вариантов картинки поста, чтобы страницы
+    получили готовые файлы и размеры без обработки картинки в запросе.
+    """
+    if post.image:
+        generate.enqueue(post.pk, post.image.name)
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import transaction
+
+from jobs.queue import task
+
+from . import caching, follows
+from .models import Follow, Post, PostQuerySet, TimelineEntry, UserStats
+from .paginators import MergedFeed
+
+BULK_BATCH_SIZE = 1000
+
+
+def _entries(user_ids, author_id, posts):
+    for user_id in user_ids:
+        for post_id, pub_date in posts:
+            yield TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+
+
+def is_pulled(author_id):
+    """
+    Посты авторов с большим числом подписчиков не раскладываются по лентам,
+    а подтягиваются при чтении ленты (см. follow_feed).
+    """
+    return UserStats.objects.filter(
+        user_id=author_id, timeline_pulled=True).exists()
+
+
+def push_threshold():
+    return settings.TIMELINE_PULL_THRESHOLD * settings.TIMELINE_PUSH_RATIO
+
+
+def mark_pulled(author_id):
+    """Переводит автора на чтение при запросе, если он стал популярным."""
+    UserStats.objects.filter(
+        user_id=author_id,
+        timeline_pulled=False,
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD
+    ).update(timeline_pulled=True)
+
+
+def schedule_push(author_id):
+    """
+    Ставит в очередь возврат автора к раскладке по лентам, если
+    подписчиков стало меньше push_threshold(). Порог ниже порога
+    популярности, поэтому колебания числа подписчиков около него не
+    заставляют каждый раз заново заполнять все ленты.
+    """
+    returning = UserStats.objects.filter(
+        user_id=author_id,
+        timeline_pulled=True,
+        followers_count__lt=push_threshold()
+    ).exists()
+    if returning:
+        push_author.enqueue(author_id)
+
+
+def pulled_author_ids(user):
+    """Авторы из подписок читателя, чьи посты читаются напрямую."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__timeline_pulled=True
+        ).values_list('author_id', flat=True)
+    )
+
+
+def fan_out_post(post):
+    """
+    Раскладывает новый пост по лентам всех подписчиков автора.
+    Возвращает id читателей, чьи ленты изменились: у популярного автора
+    это тоже все подписчики, хотя пост подтянется только при чтении.
+    """
+    user_ids = follows.follower_ids(post.author_id)
+    if is_pulled(post.author_id):
+        return user_ids
+    TimelineEntry.objects.bulk_create(
+        _entries(user_ids, post.author_id, [(post.pk, post.pub_date)]),
+        ignore_conflicts=True,
+    )
+    return user_ids
+
+
+def backfill(user_id, author_id):
+    """
+    Добавляет в ленту нового подписчика последние посты автора.
+    Более старые посты в ленту не попадают, их можно найти в профиле.
+    """
+    if is_pulled(author_id):
+        return
+    TimelineEntry.objects.bulk_create(
+        _entries([user_id], author_id, recent_posts(author_id)),
+        ignore_conflicts=True,
+    )
+
+
+def recent_posts(author_id):
+    return list(
+        Post.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-pk').values_list(
+            'pk', 'pub_date'
+        )[:settings.TIMELINE_BACKFILL_SIZE]
+    )
+
+
+@task(queue='timeline')
+def push_author(author_id):
+    """
+    Возвращает автора к раскладке по лентам и раскладывает его последние
+    посты по лентам всех подписчиков: пока автор был популярным, его
+    посты читались при запросе и в ленты не попадали. Флаг и записи
+    меняются в одной транзакции, чтобы посты не пропали из лент между ними.
+    """
+    with transaction.atomic():
+        returned = UserStats.objects.filter(
+            user_id=author_id,
+            timeline_pulled=True,
+            followers_count__lt=push_threshold()
+        ).update(timeline_pulled=False)
+        if not returned:
+            return
+        user_ids = follows.follower_ids(author_id)
+        TimelineEntry.objects.bulk_create(
+            _entries(user_ids, author_id, recent_posts(author_id)),
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    caching.forget_counts(
+        caching.follow_feed(user_id) for user_id in user_ids)
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def follow_feed(user):
+    """
+    Лента подписок: разложенные по ленте читателя посты (push) слиты
+    с постами популярных авторов, прочитанными при запросе (pull).
+    Записи ленты от авторов, ставших популярными, пропускаются, чтобы
+    посты не повторялись.
+    """
+    pulled_ids = pulled_author_ids(user)
+    pushed = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).only(
+        'pub_date',
+        'post',
+        *(f'post__{field}' for field in PostQuerySet.FEED_FIELDS)
+    )
+    if not pulled_ids:
+        return MergedFeed(
+            (pushed, ('pub_date', 'post_id'), lambda entry: entry.post))
+    pulled = Post.objects.feed().filter(author_id__in=pulled_ids)
+    return MergedFeed(
+        (
+            pushed.exclude(author_id__in=pulled_ids),
+            ('pub_date', 'post_id'),
+            lambda entry: entry.post
+        ),
+        (pulled, ('pub_date', 'pk'), lambda post: post),
+    )
@@ -0,0 +1,76 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемые файлы порциями сразу во временный файл на диске.
+    Файл больше POST_IMAGE_MAX_BYTES отбрасывается, как только его размер
+    превысит предел. У картинки читается только заголовок, и файл с
+    числом пикселей больше POST_IMAGE_MAX_PIXELS тоже отбрасывается.
+    Причины отказа попадают в request.upload_errors по именам полей.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        request.upload_errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.reject(
+                'Файл слишком большой: можно не больше '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_BYTES)}.'
+            )
+            raise SkipFile
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        try:
+            with Image.open(upload.file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width, height = settings.POST_IMAGE_MAX_PIXELS + 1, 1
+        except OSError:
+            # Не картинка: об этом сообщит проверка поля формы.
+            upload.seek(0)
+            return upload
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            self.reject(
+                f'Картинка слишком большая: {width}x{height}, можно не '
+                f'больше {settings.POST_IMAGE_MAX_PIXELS} пикселей.'
+            )
+            upload.close()
+            return None
+        upload.seek(0)
+        return upload
+
+    def reject(self, message):
+        self.request.upload_errors[self.field_name] = message
+
+
+def bounded_image_uploads(view):
+    """
+    Принимает файлы запроса через BoundedImageUploadHandler. Обработчики
+    нужно заменить до того, как CSRF-проверка прочитает тело запроса,
+    поэтому CSRF проверяется здесь же, после замены.
+    """
+    protected_view = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [BoundedImageUploadHandler(request)]
+        return protected_view(request, *args, **kwargs)
+    return wrapper
@@ -1,61 +1,109 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Max, Prefetch
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import caching, follows, search, thumbnails, timeline
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .models import Comment, Group, Post
+from .paginators import FeedPaginator
+from .uploads import bounded_image_uploads
 
 RECORDS_NUMBER_PER_PAGE = 10
 User = get_user_model()
 
 
-def paginator(request, object_list, per_page):
-    paginate = Paginator(object_list, per_page)
+def paginator(request, object_list, per_page, **kwargs):
+    paginate = FeedPaginator(object_list, per_page, **kwargs)
     page_number = request.GET.get('page')
-    page_obj = paginate.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        return paginate.get_page(page_number)
+    return paginate.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def estimate_posts_count():
+    """Оценка числа всех постов по последнему id, без прохода по таблице."""
+    return Post.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
 
 
+@caching.cache_anonymous_page
 def index(request):
-    post_list = Post.objects.select_related('author', 'group')
-    page_obj = paginator(request, post_list, RECORDS_NUMBER_PER_PAGE)
+    post_list = Post.objects.feed()
+    page_obj = paginator(
+        request,
+        post_list,
+        RECORDS_NUMBER_PER_PAGE,
+        feed=caching.INDEX_FEED,
+        estimate=estimate_posts_count
+    )
     context = {
         'page_obj': page_obj,
+        'feed_version': caching.tag_page(request, caching.INDEX_FEED),
     }
     return render(request, 'posts/index.html', context)
 
 
+@caching.cache_anonymous_page
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = paginator(request, post_list, RECORDS_NUMBER_PER_PAGE)
+    post_list = group.posts.feed()
+    page_obj = paginator(
+        request,
+        post_list,
+        RECORDS_NUMBER_PER_PAGE,
+        feed=caching.group_feed(group.pk),
+        estimate=lambda: group.posts_count
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_version': caching.tag_page(
+            request, caching.group_feed(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@caching.cache_anonymous_page
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    user_posts = user.posts.all()
-    following = False
-    if request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=user
-    ).exists():
-        following = Follow.objects.get(user=request.user, author=user)
-    page_obj = paginator(request, user_posts, RECORDS_NUMBER_PER_PAGE)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    user_posts = user.posts.feed()
+    following = follows.is_following(request.user, user)
+    page_obj = paginator(
+        request,
+        user_posts,
+        RECORDS_NUMBER_PER_PAGE,
+        feed=caching.profile_feed(user.pk),
+        estimate=lambda: user.stats.posts_count
+    )
     context = {
         'author': user,
         'following': following,
         'page_obj': page_obj,
+        'feed_version': caching.tag_page(
+            request, caching.profile_feed(user.pk)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@caching.cache_anonymous_page
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    caching.tag_page(request, caching.post_page(post_id))
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group').prefetch_related(
+            Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('author')
+            )
+        ),
+        pk=post_id
+    )
+    # На странице есть число постов автора.
+    caching.tag_page(request, caching.author_stats(post.author_id))
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
@@ -64,13 +112,37 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+# Целиком страницы поиска не кешируются: каждая новая строка запроса
+# заняла бы запись в кеше и вытеснила бы страницы лент.
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search.search_posts(
+        query,
+        RECORDS_NUMBER_PER_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@bounded_image_uploads
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        upload_errors=request.upload_errors
+    )
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        thumbnails.pregenerate(new_post)
         return redirect('posts:profile', request.user)
     context = {
         'form': form,
@@ -79,19 +151,24 @@ def post_create(request):
 
 
 @login_required
+@bounded_image_uploads
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=request.upload_errors
     )
-    if post.author != request.user:
+    if post.author_id != request.user.id:
         return redirect('posts:post_detail', post_id)
     if form.is_valid():
         edited_post = form.save(commit=False)
         edited_post.author = request.user
         edited_post.save()
+        if 'image' in form.changed_data:
+            thumbnails.pregenerate(edited_post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -102,6 +179,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -115,9 +193,12 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    author_list = [follow.author for follow in request.user.follower.all()]
-    post_list = Post.objects.filter(author__in=author_list)
-    page_obj = paginator(request, post_list, RECORDS_NUMBER_PER_PAGE)
+    page_obj = paginator(
+        request,
+        timeline.follow_feed(request.user),
+        RECORDS_NUMBER_PER_PAGE,
+        feed=caching.follow_feed(request.user.pk)
+    )
     context = {
         'page_obj': page_obj,
     }
@@ -125,21 +206,16 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(
-        user=request.user, author=author).exists()
-    if author != request.user and not following:
-        Follow.objects.create(user=request.user, author=author)
+    follows.follow(request.user, author)
     return redirect('posts:profile', username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(
-        user=request.user, author=author).exists()
-    if following:
-        following_object = Follow.objects.get(user=request.user, author=author)
-        following_object.delete()
+    follows.unfollow(request.user, author)
     return redirect('posts:profile', username)
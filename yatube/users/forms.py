@@ -1,5 +1,8 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth import get_user_model
+from django.template import loader
+
+from .tasks import send_email
 
 
 User = get_user_model()
@@ -9,3 +12,20 @@ class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Письмо для сброса пароля отправляет фоновая задача."""
+
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_message = None
+        if html_email_template_name is not None:
+            html_message = loader.render_to_string(
+                html_email_template_name, context)
+        send_email.enqueue(
+            subject, body, from_email, [to_email], html_message)
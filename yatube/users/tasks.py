@@ -0,0 +1,14 @@
+from django.core.mail import send_mail
+
+from jobs.queue import task
+
+
+@task(queue='email')
+def send_email(subject, body, from_email, recipient_list, html_message=None):
+    send_mail(
+        subject,
+        body,
+        from_email,
+        recipient_list,
+        html_message=html_message
+    )
@@ -8,6 +8,7 @@ from django.contrib.auth.views import PasswordResetCompleteView
 from django.urls import path
 
 from . import views
+from .forms import QueuedPasswordResetForm
 
 app_name = 'users'
 
@@ -40,6 +41,7 @@ urlpatterns = [
     path(
         'password_reset/',
         PasswordResetView.as_view(
+            form_class=QueuedPasswordResetForm,
             template_name='users/password_reset_form.html'
         ),
         name='password_reset_form'
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'jobs.apps.JobsConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
@@ -82,6 +84,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.cache.fragment_cache_timeout',
             ],
         },
     },
@@ -97,9 +100,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections between requests instead of reopening the file
+        # and reapplying the pragmas every time
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Applied to every new SQLite connection by core.db, in this order.
+# WAL lets readers run alongside the writer, busy_timeout (ms) makes
+# writers wait for the lock instead of failing with "database is locked",
+# NORMAL sync is durable across app crashes in WAL mode, mmap_size is in
+# bytes and a negative cache_size is in KiB per connection.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -139,10 +158,24 @@ USE_TZ = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Media files whose names change with their content: sorl thumbnails,
+# image variants and content-addressed originals are cached for a year
+MEDIA_IMMUTABLE_PATHS = (
+    r'^(cache/|posts/variants/|posts/[0-9a-f]{2}/[0-9a-f]{64}\.)'
+)
+MEDIA_CACHE_MAX_AGE = 60 * 60
+# Let the front-end server send media files: None, 'x-accel-redirect'
+# (nginx, internal location at MEDIA_ACCEL_REDIRECT_PREFIX) or 'x-sendfile'
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic adds content hashes to file names and writes .gz (and .br,
+# when brotli is installed) copies that core.static.serve picks from
+STATICFILES_STORAGE = 'core.static.CompressedManifestStaticFilesStorage'
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -152,15 +185,93 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Cache
+# One SQLite file shared by all worker processes of the host, so fragment
+# caches and their invalidation are consistent between workers. It lives
+# outside the source tree; set CACHE_LOCATION to move it.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube', 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Feed fragments are invalidated by bumping the feed generation on every
+# post and comment write, so the TTL only bounds memory use.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+# Whole pages for anonymous readers are invalidated the same way
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Feed paginators keep the number of posts of every feed in the cache
+# for this many seconds; new and deleted posts shift it in place.
+FEED_COUNT_TIMEOUT = 60 * 10
+# Take page counts from stored counters instead of COUNT(*) queries
+FEED_COUNT_ESTIMATE = False
+
+# Filtered admin lists count at most this many rows for their paginator
+ADMIN_COUNT_LIMIT = 10000
+
+# Tests run with a cache in process memory instead of the shared file
+TEST_RUNNER = 'core.testing.IsolatedCacheTestRunner'
+
 # 403 error customization
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Follow feed: how many recent posts of an author a new follower gets
+TIMELINE_BACKFILL_SIZE = 100
+# Authors with at least this many followers are pulled at read time
+# instead of being fanned out to every follower's timeline
+TIMELINE_PULL_THRESHOLD = 1000
+# Pulled authors go back to fan-out only below this share of the pull
+# threshold, so followers going back and forth around it do not refill
+# every timeline each time
+TIMELINE_PUSH_RATIO = 0.9
+# Follower and following id sets are cached for this many seconds;
+# every follow and unfollow drops the sets it changes.
+FOLLOW_IDS_CACHE_TIMEOUT = 60 * 60
+
+# Uploaded post images are rejected above these limits before decoding
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+# Saved originals are auto-oriented, stripped of metadata, downscaled to
+# this longest side and recompressed with this quality
+POST_IMAGE_MAX_SIDE = 2560
+POST_IMAGE_QUALITY = 85
+# Unreferenced images touched less than this many seconds ago are left
+# for collect_media: an upload of the same content may be reusing the file
+POST_IMAGE_COLLECT_MIN_AGE = 60 * 10
+
+# Post images are served as variants of these widths in WebP and JPEG
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_QUALITY = 80
+
+# sorl-thumbnail records found for a feed page are also kept in the memory
+# of the process: at most this many records, each for this many seconds
+THUMBNAIL_KVSTORE = 'posts.kvstore.PreloadingKVStore'
+THUMBNAIL_MEMORY_CACHE_SIZE = 1000
+THUMBNAIL_MEMORY_CACHE_TIMEOUT = 60 * 5
+
+# Background jobs: queue name -> how many of its jobs one worker runs at once
+JOBS_QUEUES = {
+    'default': 4,
+    'thumbnails': 2,
+    'email': 1,
+    'timeline': 1,
+}
+JOBS_MAX_ATTEMPTS = 5
+# A claimed job becomes visible to other workers again after this many
+# seconds, so jobs of a crashed worker are not lost
+JOBS_VISIBILITY_TIMEOUT = 60 * 5
+# Retries back off exponentially from JOBS_RETRY_DELAY seconds
+JOBS_RETRY_DELAY = 10
+JOBS_MAX_RETRY_DELAY = 60 * 60
+JOBS_POLL_INTERVAL = 1
@@ -13,11 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core import media, static
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -25,6 +28,11 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        media.serve,
+        name='media'
+    ),
 ]
 
 handler404 = 'core.views.page_not_found'
@@ -35,6 +43,11 @@ if settings.DEBUG:
     import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
     urlpatterns += staticfiles_urlpatterns()
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
+else:
+    urlpatterns += (
+        re_path(
+            r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+            static.serve,
+            name='static'
+        ),
     )